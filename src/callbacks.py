@@ -1,15 +1,48 @@
 from dash import Input, Output, State, ALL, no_update, callback_context
 import dash
 import json
+import os
+import hashlib
 from dash.exceptions import PreventUpdate
 from urllib.parse import unquote
-from interactive_map import create_map_figure
-from data_loader import prepare_table_data, get_table_styles
-from config import MAP_FITS, MAP_PNG, NOTES_FILE, TOGGLE_BANDS
+from interactive_map import create_field_map_figure
+from export import export_query_string, collect_export_files, export_archive_size, write_export_archive
+from jobs import job_result_path, prune_job_results, keep_job_results
+from coalesce import Coalescer, Superseded
+from contact_sheet import contact_sheet_key, build_contact_sheets
+from html_utils import contact_sheet_images
+from histograms import slider_histograms, histogram_figure
+from data_loader import (
+    prepare_table_data, filter_table_data, round_table_data, source_name_for_row, snapshot_version, get_table_styles,
+    data_version, load_combined_catalog, row_for_source
+)
+from sed import sed_figure
+from similarity import similarity_distances
+from config import (
+    TOGGLE_BANDS, RANGE_FILTERS, ASSET_MODES, FIELDS,
+    EXPORT_MAX_SOURCES, EXPORT_MAX_BYTES, JOB_POLL_INTERVAL, CONTACT_SHEET_MAX_SOURCES, VECTOR_CONTOURS,
+    INTERACTIVE_SED, SED_COMPARE_OPTIONS
+)
 import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
 
+coalescer = Coalescer()
+
+
+def coalesced(channel, tab_id, field, compute, *args):
+    """
+    Run compute(checkpoint) through the coalescer: newer calls of the same tab on channel abandon this one,
+    and calls with the same field, args and data version share one computation.
+    """
+    token = coalescer.begin(tab_id, channel)
+    key = (channel, field, json.dumps(args, sort_keys=True, default=str), data_version(field))
+    try:
+        return coalescer.run(key, token, compute)
+    except Superseded:
+        raise PreventUpdate
+
+
 def register_callbacks(app, notes):
     # === Save Note Callback ===
     @app.callback(
@@ -21,30 +54,44 @@ def register_callbacks(app, notes):
     )
     def save_user_note(n_clicks, note_text, source_name):
         if source_name:
-            notes[source_name] = note_text
-            with open(NOTES_FILE, "w") as f:
-                json.dump(notes, f, indent=2)
+            notes.save(source_name, note_text)
             return "✅ Notes saved!"
         return "⚠️ Could not save note."
 
+    # === Field selection ===
+    @app.callback(
+        Output("field-store", "data"),
+        Input("field-dropdown", "value"),
+        State("field-store", "data"),
+        prevent_initial_call=True
+    )
+    def select_field(field, current_field):
+        if field == current_field:
+            raise PreventUpdate
+        return field
+
     # === Navigation to cutout page ===
     @app.callback(
         Output("url", "pathname", allow_duplicate=True),
         Input("catalog-table", "active_cell"),
         Input("graph-id", "clickData"),
         State("catalog-table", "data"),
+        State("field-store", "data"),
+        State("map-version", "data"),
         prevent_initial_call=True
     )
-    def go_to_viewer(active_cell, clickData, visible_table_data):
+    def go_to_viewer(active_cell, clickData, visible_table_data, field, map_version):
         # --- If user clicks on a map point ---
-        if clickData and "points" in clickData:
+        if callback_context.triggered_id == "graph-id":
             try:
-                source_name = clickData["points"][0]["customdata"]
-                if isinstance(source_name, list):
-                    source_name = source_name[0]
-                return f"/viewer/{source_name}"
-            except Exception:
-                pass
+                row_id = clickData["points"][0]["customdata"]
+                if isinstance(row_id, list):
+                    row_id = row_id[0]
+            except (TypeError, KeyError, IndexError):
+                return dash.no_update
+            # A figure drawn from an older catalog snapshot cannot be resolved; wait for the redraw
+            source_name = source_name_for_row(row_id, map_version, field)
+            return f"/viewer/{source_name}" if source_name is not None else dash.no_update
 
         # --- If user clicks on a table row ---
         if active_cell and visible_table_data:
@@ -80,11 +127,10 @@ def register_callbacks(app, notes):
         State("sorted-table-data", "data"),
         prevent_initial_call=True
     )
-    def scroll_sources(trigger_id, current_source, table_data):
-        if not trigger_id or not table_data:
+    def scroll_sources(trigger_id, current_source, sources):
+        if not trigger_id or not sources:
             raise dash.exceptions.PreventUpdate
 
-        sources = [row["source_name"] for row in table_data]
         try:
             current_index = sources.index(current_source)
         except ValueError:
@@ -106,101 +152,232 @@ def register_callbacks(app, notes):
         Output("result-count", "children"),
         Output("graph-id", "figure"),
         Output("sorted-table-data", "data"),
+        Output("map-version", "data"),
         Input("search-input", "value"),
+        Input("notes-search", "value"),
         Input("redshift-slider", "value"),
         Input("s220-slider", "value"),
         Input("s150-slider", "value"),
         Input("a90-slider", "value"),
         Input("a220-slider", "value"),
+        Input("tdust-slider", "value"),
+        Input("lir-slider", "value"),
         Input("color-variable-dropdown", "value"),
         Input("catalog-table", "selected_rows"),
         Input("catalog-table", "sort_by"),
+        Input("similar-to", "value"),
+        State("field-store", "data"),
+        State("tab-id", "data"),
     )
-    def update_table_and_map(search_text, redshift_range, s220_range, s150_range, a90_range, a220_range,
-                             color_by, selected_rows, sort_by):
-        import plotly.graph_objects as go
-        import numpy as np
-        import pandas as pd
-
-        df = prepare_table_data(notes)
-
-        # --- Apply search filter ---
-        if search_text:
-            search_text = search_text.lower()
-            df = df[df["source_name"].str.lower().str.contains(search_text)]
-
-        # --- Apply redshift filter ---
-        if redshift_range:
-            z_min, z_max = redshift_range
-            df = df[df["z"].between(z_min, z_max)]
-
-        # --- Apply S220 filter ---
-        if s220_range:
-            s220_min, s220_max = s220_range
-            if "spt3g_s220(mjy)" in df.columns:
-                df = df[df["spt3g_s220(mjy)"].between(s220_min, s220_max)]
-
-        # --- Apply S150 filter ---
-        if s150_range:
-            s150_min, s150_max = s150_range
-            if "spt3g_s150(mjy)" in df.columns:
-                df = df[df["spt3g_s150(mjy)"].between(s150_min, s150_max)]
-
-        # --- Apply A90 filter ---
-        if a90_range:
-            a90_min, a90_max = a90_range
-            if "spt3g_alpha90" in df.columns:
-                df = df[df["spt3g_alpha90"].between(a90_min, a90_max)]
-
-        # --- Apply A220 filter ---
-        if a220_range:
-            a220_min, a220_max = a220_range
-            if "spt3g_alpha220" in df.columns:
-                df = df[df["spt3g_alpha220"].between(a220_min, a220_max)]
-
-        # --- Apply sorting ---
-        if sort_by:
-            for sort in reversed(sort_by):
-                df.sort_values(
-                    by=sort["column_id"],
-                    ascending=(sort["direction"] == "asc"),
-                    inplace=True
-                )
-
-        # --- Create map figure ---
-        fig = create_map_figure(
-            catalog_df=df,
-            fits_path=MAP_FITS,
-            png_path="/assets/spt2_itermap_20120621_PLW.jpg",
-            png_path_local=MAP_PNG,
-            color_by=color_by
-        )
+    def update_table_and_map(search_text, notes_query, redshift_range, s220_range, s150_range, a90_range,
+                             a220_range, tdust_range, lir_range, color_by, selected_rows, sort_by, similar_to,
+                             field, tab_id):
+        ranges = dict(zip(RANGE_FILTERS, [redshift_range, s220_range, s150_range, a90_range, a220_range,
+                                          tdust_range, lir_range]))
+
+        def compute(checkpoint):
+            df = prepare_table_data(notes, field)
+
+            # --- Apply search, slider filters and sorting ---
+            note_matches = notes.search(notes_query) if notes_query else None
+            df = filter_table_data(df, search_text, ranges, sort_by, note_matches)
+            count_text = f"Showing {len(df)} result(s)"
+            checkpoint()
+
+            # --- Most similar first, overriding the column sort ---
+            reference_row = row_for_source(similar_to, field) if similar_to else None
+            if reference_row is not None:
+                df = df.iloc[np.argsort(similarity_distances(reference_row, df.index, field), kind="stable")]
+                count_text += f", most similar to {similar_to} first"
+
+            # --- Create map figure ---
+            checkpoint()
+            fig = create_field_map_figure(df, field, color_by=color_by)
+
+            # --- Highlight selected source ---
+            if selected_rows:
+                try:
+                    selected_row_id = df.index[selected_rows[0]]
+
+                    for trace in fig["data"]:
+                        if trace["customdata"] is not None and selected_row_id in trace["customdata"]:
+                            index = list(trace["customdata"]).index(selected_row_id)
+                            fig.add_trace(go.Scattergl(
+                                x=[trace["x"][index]],
+                                y=[trace["y"][index]],
+                                mode="markers",
+                                marker=dict(
+                                    size=18,
+                                    color="white",
+                                    symbol="circle-open",
+                                    line=dict(width=5.5)
+                                ),
+                                showlegend=False
+                            ))
+                            break
+                except Exception:
+                    pass
+
+            checkpoint()
+            # Prev/Next on the viewer only needs the order of the source names
+            return (round_table_data(df).to_dict("records"), count_text, fig, df["source_name"].tolist(),
+                    snapshot_version(field))
+
+        return coalesced("table", tab_id, field, compute, search_text, notes_query, ranges, color_by,
+                         selected_rows, sort_by, similar_to)
+
+    # === Cross-filtered distributions above the range sliders ===
+    @app.callback(
+        [Output(f"{key}-hist", "figure") for key in RANGE_FILTERS],
+        Input("search-input", "value"),
+        Input("notes-search", "value"),
+        Input("redshift-slider", "value"),
+        Input("s220-slider", "value"),
+        Input("s150-slider", "value"),
+        Input("a90-slider", "value"),
+        Input("a220-slider", "value"),
+        Input("tdust-slider", "value"),
+        Input("lir-slider", "value"),
+        State("field-store", "data"),
+        State("tab-id", "data"),
+    )
+    def update_slider_histograms(search_text, notes_query, redshift_range, s220_range, s150_range, a90_range,
+                                 a220_range, tdust_range, lir_range, field, tab_id):
+        ranges = dict(zip(RANGE_FILTERS, [redshift_range, s220_range, s150_range, a90_range, a220_range,
+                                          tdust_range, lir_range]))
 
-        # --- Highlight selected source ---
-        if selected_rows:
-            try:
-                selected_source = df.iloc[selected_rows[0]]["source_name"]
-
-                for trace in fig["data"]:
-                    if "customdata" in trace and selected_source in trace["customdata"]:
-                        index = list(trace["customdata"]).index(selected_source)
-                        fig.add_trace(go.Scattergl(
-                            x=[trace["x"][index]],
-                            y=[trace["y"][index]],
-                            mode="markers",
-                            marker=dict(
-                                size=18,
-                                color="white",
-                                symbol="circle-open",
-                                line=dict(width=5.5)
-                            ),
-                            showlegend=False
-                        ))
-                        break
-            except Exception:
-                pass
+        def compute(checkpoint):
+            note_matches = notes.search(notes_query) if notes_query else None
+            counts = slider_histograms(prepare_table_data(notes, field), search_text, ranges, field, note_matches)
+            checkpoint()
+            return [histogram_figure(key, counts[key], ranges[key], field) for key in RANGE_FILTERS]
+
+        return coalesced("histograms", tab_id, field, compute, search_text, notes_query, ranges)
 
-        return df.to_dict("records"), f"Showing {len(df)} result(s)", fig, df.to_dict("records")
+    # === Build the export of the current selection in a background job ===
+    @app.callback(
+        Output("export-download", "href"),
+        Output("export-download", "style"),
+        Output("export-status", "children"),
+        Input("export-button", "n_clicks"),
+        State("search-input", "value"),
+        State("notes-search", "value"),
+        State("redshift-slider", "value"),
+        State("s220-slider", "value"),
+        State("s150-slider", "value"),
+        State("a90-slider", "value"),
+        State("a220-slider", "value"),
+        State("tdust-slider", "value"),
+        State("lir-slider", "value"),
+        State("catalog-table", "sort_by"),
+        State("field-store", "data"),
+        background=True,
+        running=[
+            (Output("export-button", "disabled"), True, False),
+            (Output("export-progress", "style"), {"width": "200px", "marginLeft": "20px"}, {"display": "none"}),
+        ],
+        progress=[Output("export-progress", "value"), Output("export-progress", "max")],
+        interval=JOB_POLL_INTERVAL,
+        cache_args_to_ignore=[0],
+        prevent_initial_call=True
+    )
+    def prepare_export(set_progress, n_clicks, search_text, notes_query, redshift_range, s220_range, s150_range,
+                       a90_range, a220_range, tdust_range, lir_range, sort_by, field):
+        hidden = {"display": "none"}
+        ranges = dict(zip(RANGE_FILTERS, [redshift_range, s220_range, s150_range, a90_range, a220_range,
+                                          tdust_range, lir_range]))
+        note_matches = notes.search(notes_query) if notes_query else None
+        df = filter_table_data(prepare_table_data(notes, field), search_text, ranges, sort_by, note_matches)
+        if len(df) > EXPORT_MAX_SOURCES:
+            return None, hidden, f"⚠️ Export is limited to {EXPORT_MAX_SOURCES} sources ({len(df)} selected)."
+
+        table_bytes = round_table_data(df).to_csv(index=False).encode("utf-8")
+        files = collect_export_files(df["source_name"], ASSET_MODES, FIELDS[field]["asset_root"])
+        size = export_archive_size(table_bytes, files)
+        if size > EXPORT_MAX_BYTES:
+            return None, hidden, f"⚠️ Export is limited to {EXPORT_MAX_BYTES / 1e9:.1f} GB ({size / 1e9:.1f} GB selected)."
+
+        query = export_query_string(field, search_text, ranges, sort_by, notes_query=notes_query)
+        name = hashlib.sha1(f"{query}{data_version(field)}".encode("utf-8")).hexdigest() + ".tar"
+        path = job_result_path(name)
+        prune_job_results()
+        if not os.path.exists(path):
+            write_export_archive(path, "catalog.csv", table_bytes, files,
+                                 progress=lambda done, total: set_progress((done, total)))
+        keep_job_results([name])
+
+        return f"/export/jobs/{name}", {"marginLeft": "20px"}, f"{len(df)} source(s), {size / 1e6:.1f} MB"
+
+    # === Contact sheet of the current selection, built in a background job ===
+    @app.callback(
+        Output("contact-sheet", "children"),
+        Output("contact-sheet-status", "children"),
+        Input("contact-sheet-button", "n_clicks"),
+        State("contact-sheet-band", "value"),
+        State("sorted-table-data", "data"),
+        State("res-mode-store", "data"),
+        State("field-store", "data"),
+        background=True,
+        running=[
+            (Output("contact-sheet-button", "disabled"), True, False),
+            (Output("contact-sheet-progress", "style"), {"width": "200px", "marginLeft": "20px"},
+             {"display": "none"}),
+        ],
+        progress=[Output("contact-sheet-progress", "value"), Output("contact-sheet-progress", "max")],
+        interval=JOB_POLL_INTERVAL,
+        cache_args_to_ignore=[0],
+        prevent_initial_call=True
+    )
+    def prepare_contact_sheet(set_progress, n_clicks, band, sources, mode, field):
+        if not sources:
+            return [], "⚠️ No sources selected."
+        mode = mode if mode in ASSET_MODES else "native"
+        shown = sources[:CONTACT_SHEET_MAX_SOURCES]
+        key = contact_sheet_key(shown, band, mode, data_version(field))
+        prune_job_results()
+        sheets = build_contact_sheets(shown, band, mode, FIELDS[field]["asset_root"], key,
+                                      progress=lambda done, total: set_progress((done, total)))
+        keep_job_results([f"{key}.json"] + [sheet["name"] for sheet in sheets])
+
+        status = f"{len(shown)} source(s)"
+        if len(sources) > len(shown):
+            status = f"First {len(shown)} of {len(sources)} source(s)"
+        return contact_sheet_images(sheets), status + " — click a tile to open its viewer page"
+
+    # === Overplot other sources on the SED (see layouts.sed_panel) ===
+    if INTERACTIVE_SED:
+        @app.callback(
+            Output("sed-graph", "figure"),
+            Input("sed-compare", "value"),
+            State("current-source", "data"),
+            State("field-store", "data"),
+            State("theme-store", "data"),
+            prevent_initial_call=True
+        )
+        def update_sed(compare, source_name, field, theme):
+            catalog = load_combined_catalog(field)
+            names = [source_name] + [name for name in (compare or []) if name != source_name]
+            rows = catalog[catalog["source_name"].isin(names)]
+            # current source first, then in the order they were picked
+            rows = rows.iloc[np.argsort([names.index(name) for name in rows["source_name"]], kind="stable")]
+            return sed_figure(rows, theme or "dark")
+
+        # Only the sources matching the typed text are sent as options, plus those already picked
+        @app.callback(
+            Output("sed-compare", "options"),
+            Input("sed-compare", "search_value"),
+            State("sed-compare", "value"),
+            State("current-source", "data"),
+            State("field-store", "data"),
+            prevent_initial_call=True
+        )
+        def sed_compare_options(search, compare, source_name, field):
+            if not search:
+                raise PreventUpdate
+            names = load_combined_catalog(field)["source_name"]
+            picked = compare or []
+            matches = names.str.contains(search, case=False, regex=False) & (names != source_name)
+            return picked + names[matches & ~names.isin(picked)].head(SED_COMPARE_OPTIONS).tolist()
 
     # === Lightbox for enlarging selected image ===
     @app.callback(
@@ -298,7 +475,25 @@ def register_callbacks(app, notes):
     def store_res_mode(value):
         return value
 
-    # Clientside callback to update image sources
+    # === Per-tab ID, used to coalesce the filter callbacks of one tab (see coalesce.py) ===
+    app.clientside_callback(
+        """
+        function(pathname, tabId) {
+            if (tabId) {
+                return window.dash_clientside.no_update;
+            }
+            if (window.crypto && window.crypto.randomUUID) {
+                return window.crypto.randomUUID();
+            }
+            return Date.now().toString(36) + Math.random().toString(36).slice(2);
+        }
+        """,
+        Output("tab-id", "data"),
+        Input("url", "pathname"),
+        State("tab-id", "data")
+    )
+
+    # Clientside callback to update image sources and release the deferred (lazy) panels
     app.clientside_callback(
         """
         function(resMode) {
@@ -313,7 +508,18 @@ def register_callbacks(app, notes):
                         const folder = id.folder;
                         const suffix = id.suffix;
                         const sourceName = id.index.split('_').slice(1).join('_');
-                        const newSrc = `/assets/${resMode}/${folder}/${sourceName}_${suffix}.png`;
+                        const newSrc = img.dataset[resMode] ||
+                            `/assets/${id.root || ''}${resMode}/${folder}/${sourceName}_${suffix}.png`;
+                        if (img.getAttribute('src') === newSrc) {
+                            return;
+                        }
+                        if (img.dataset.src !== undefined) {
+                            // Deferred panel: fetch after the first row, only when near the viewport
+                            img.loading = 'lazy';
+                            img.decoding = 'async';
+                            img.fetchPriority = 'low';
+                            img.dataset.src = newSrc;
+                        }
                         console.log('Updating:', img.src, '->', newSrc);
                         img.src = newSrc;
                     }
@@ -326,4 +532,45 @@ def register_callbacks(app, notes):
         """,
         Output("debug-output", "children"),
         Input("res-mode-store", "data")
-    )
\ No newline at end of file
+    )
+
+    # === Vector contours (see contours.py) ===
+    # Draw the selected levels of the current resolution mode as an SVG over each cutout: the shared paths on the
+    # bands with the 220GHz footprint, reprojected paths on the others and nothing where neither was traced
+    if VECTOR_CONTOURS:
+        app.clientside_callback(
+            """
+            function(contours, levels, show, resMode) {
+                const outputs = window.dash_clientside.callback_context.outputs_list;
+                const traced = contours && contours[resMode || 'native'];
+                const bandSrc = band => {
+                    let bandPaths = null;
+                    if (show && traced) {
+                        bandPaths = traced.bands.includes(band) ? traced.paths : traced.band_paths[band];
+                    }
+                    const paths = bandPaths ? (levels || []).map(level => {
+                        const key = String(level);
+                        const d = (bandPaths[key] || []).join(' ');
+                        const color = contours.colors[key] || '#ffffff';
+                        return d ? `<path d='${d}' stroke='${color}' vector-effect='non-scaling-stroke'/>` : '';
+                    }).join('') : '';
+                    const svg = "<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 1 1' " +
+                        "preserveAspectRatio='none' fill='none' stroke-width='1.5'>" + paths + "</svg>";
+                    return 'data:image/svg+xml,' + encodeURIComponent(svg);
+                };
+                const srcs = {};
+                return outputs.map(output => {
+                    const band = output.id.band;
+                    if (!(band in srcs)) {
+                        srcs[band] = bandSrc(band);
+                    }
+                    return srcs[band];
+                });
+            }
+            """,
+            Output({"type": "contour_overlay", "index": ALL, "band": ALL}, "src"),
+            Input("contour-data", "data"),
+            Input("contour-levels", "value"),
+            Input("contour-toggle", "value"),
+            Input("res-mode-store", "data")
+        )
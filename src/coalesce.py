@@ -0,0 +1,106 @@
+"""
+Single-flight coalescing of expensive callbacks.
+
+Each browser tab sends a tab ID (the "tab-id" store). Every call from a tab supersedes that tab's earlier
+calls on the same channel, and a computation checks at its phase boundaries whether anyone still wants its
+result, abandoning the work if not. Identical concurrent calls, from any tab or user, share one computation.
+
+Coalescing is per worker process; calls landing on different workers compute independently.
+"""
+import threading
+from collections import OrderedDict
+
+# Number of tabs whose latest call is remembered, most recently active kept
+MAX_TABS = 4096
+
+
+class Superseded(Exception):
+    """
+    Raised when every caller waiting for a computation has made a newer call.
+    """
+
+
+class _Flight:
+    def __init__(self, token):
+        self.tokens = {token}
+        self.done = threading.Event()
+        self.abandoned = False
+        self.result = None
+        self.error = None
+
+
+class Coalescer:
+    def __init__(self, max_tabs=MAX_TABS):
+        self.max_tabs = max_tabs
+        self._lock = threading.Lock()
+        self._latest = OrderedDict()
+        self._flights = {}
+
+    def begin(self, tab_id, channel):
+        """
+        Register a new call of a tab on a channel (e.g. "table"), superseding its earlier ones.
+
+        Returns:
+        - token identifying the call, for run()
+        """
+        if not tab_id:
+            return None
+        with self._lock:
+            key = (tab_id, channel)
+            generation = self._latest.pop(key, 0) + 1
+            self._latest[key] = generation
+            while len(self._latest) > self.max_tabs:
+                self._latest.popitem(last=False)
+            return key, generation
+
+    def superseded(self, token):
+        # Calls without a tab ID are never superseded
+        return token is not None and self._latest.get(token[0], token[1]) != token[1]
+
+    def run(self, key, token, compute):
+        """
+        Return compute(checkpoint), sharing the computation with concurrent calls of the same key.
+
+        compute should call checkpoint() between its phases; it raises Superseded once all callers
+        waiting for the result are superseded. Raises Superseded if the caller's own call is superseded.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight(token)
+            else:
+                flight.tokens.add(token)
+
+        if not leader:
+            flight.done.wait()
+            if flight.abandoned or self.superseded(token):
+                raise Superseded()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        def checkpoint():
+            with self._lock:
+                if not flight.abandoned and all(self.superseded(t) for t in flight.tokens):
+                    flight.abandoned = True
+                    del self._flights[key]
+            if flight.abandoned:
+                raise Superseded()
+
+        try:
+            flight.result = compute(checkpoint)
+        except Superseded:
+            raise
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+
+        if self.superseded(token):
+            raise Superseded()
+        return flight.result
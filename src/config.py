@@ -1,4 +1,5 @@
 import os
+import json
 
 NOTES_FILE = os.getenv('SPT3G_VIEWER_NOTES_FILE', "notes.json")
 
@@ -17,13 +18,71 @@ FILE_PREFIX = os.getenv('SPT3G_VIEWER_URL_FILE_PREFIX', "")
 # === Constants ===
 MAP_FITS = FILE_PREFIX + "assets/spt2_itermap_20120621_PLW.fits"
 MAP_PNG = FILE_PREFIX + "assets/spt2_itermap_20120621_PLW.jpg"
+CATALOG_CSV = FILE_PREFIX + "assets/all_spt3g_sources_in_spire_field_20250519_no_NaNs.csv"
+MBB_FIT_CSV = FILE_PREFIX + "assets/all_spt3g_sources_in_spire_field_20250519_no_NaNs_mbb_fit_params.csv"
+
+# === Fields ===
+# Each field has its own catalog, background map and cutout tree. asset_root is the sub-directory of
+# assets/ holding the field's native/ and convolved/ trees ("" for the top level).
+# More fields can be registered with a JSON file of the same shape, keyed by field name.
+FIELDS = {
+    "ssdf": {
+        "label": "100 sq. deg. SSDF",
+        "catalog_csv": CATALOG_CSV,
+        "mbb_fit_csv": MBB_FIT_CSV,
+        "map_fits": MAP_FITS,
+        "map_png": MAP_PNG,
+        "map_url": "/assets/spt2_itermap_20120621_PLW.jpg",
+        "asset_root": "",
+    },
+}
+FIELDS_FILE = os.getenv('SPT3G_VIEWER_FIELDS_FILE')
+if FIELDS_FILE:
+    with open(FIELDS_FILE) as f:
+        FIELDS.update(json.load(f))
+DEFAULT_FIELD = os.getenv('SPT3G_VIEWER_DEFAULT_FIELD', "ssdf")
+FIELD_OPTIONS = [{"label": field["label"], "value": name} for name, field in FIELDS.items()]
+
+# Upper bound on the memory of the loaded field catalogs and their derived data, per worker
+FIELD_CACHE_MAX_BYTES = int(os.getenv('SPT3G_VIEWER_FIELD_CACHE_MAX_BYTES', str(512 * 1024**2)))
+
+# === Modified blackbody (MBB) SED model, see sed.py ===
+# The viewer's SED panel shows the best_fit_plots PNG; with INTERACTIVE_SED it is a Plotly MBB model instead
+INTERACTIVE_SED = os.getenv('SPT3G_VIEWER_INTERACTIVE_SED', 'false').lower() == 'true'
+# Columns of the MBB fit CSV holding log10 of the normalization, the dust temperature (K) and beta. There is no
+# default: the MBB columns stay empty until all three are set. sed.add_mbb_columns copies them to the
+# mbb_log_norm, t_dust(k) and mbb_beta columns of the catalog.
+MBB_COLUMNS = {
+    "log_norm": os.getenv('SPT3G_VIEWER_MBB_LOG_NORM_COLUMN'),
+    "t_dust": os.getenv('SPT3G_VIEWER_MBB_T_DUST_COLUMN'),
+    "beta": os.getenv('SPT3G_VIEWER_MBB_BETA_COLUMN'),
+}
+# 10**log_norm is the observed flux density, in units of MBB_NORM_MJY mJy, at rest-frame MBB_REFERENCE_UM
+MBB_REFERENCE_UM = float(os.getenv('SPT3G_VIEWER_MBB_REFERENCE_UM', '850'))
+MBB_NORM_MJY = float(os.getenv('SPT3G_VIEWER_MBB_NORM_MJY', '1000'))
+# Standardized catalog features of the "similar sources" nearest-neighbour search (see similarity.py)
+SIMILARITY_FEATURES = [
+    "z", "spt3g_s220(mjy)", "spt3g_s150(mjy)", "spt3g_alpha90", "spt3g_alpha220",
+    "mbb_log_norm", "t_dust(k)", "mbb_beta",
+]
+SIMILAR_SOURCES_COUNT = int(os.getenv('SPT3G_VIEWER_SIMILAR_SOURCES_COUNT', '8'))
+
+# Catalog flux column -> observed frequency (GHz), drawn as photometry points on the SED
+SED_PHOTOMETRY = {
+    "spt3g_s220(mjy)": 220.0,
+    "spt3g_s150(mjy)": 150.0,
+}
+# Source names offered by the SED overplot dropdown for the text typed into it
+SED_COMPARE_OPTIONS = int(os.getenv('SPT3G_VIEWER_SED_COMPARE_OPTIONS', '20'))
 
 COLOR_OPTIONS = [
     {"label": "Phot-z", "value": "z"},
     {"label": "S(220GHz)", "value": "spt3g_s220(mjy)"},
     {"label": "S(150GHz)", "value": "spt3g_s150(mjy)"},
     {"label": "alpha90", "value": "spt3g_alpha90"},
-    {"label": "alpha220", "value": "spt3g_alpha220"}
+    {"label": "alpha220", "value": "spt3g_alpha220"},
+    {"label": "T_dust", "value": "t_dust(k)"},
+    {"label": "log L_IR", "value": "log_lir(lsun)"}
 ]
 
 TABLE_COLUMNS = [
@@ -35,7 +94,121 @@ TABLE_COLUMNS = [
     {"name": "S(150GHz)", "id": "spt3g_s150(mjy)"},
     {"name": "alpha90", "id": "spt3g_alpha90"},
     {"name": "alpha220", "id": "spt3g_alpha220"},
+    {"name": "T_dust", "id": "t_dust(k)"},
+    {"name": "log L_IR", "id": "log_lir(lsun)"},
     {"name": "Note?", "id": "has_note"},
 ]
 
 TOGGLE_BANDS = ["mk", "spire250", "spire350", "spire500"]
+
+# === Contact sheets (see contact_sheet.py) ===
+# Bands offered for the home page contact sheet: the SPT3G bands and the toggleable ones
+CONTACT_SHEET_BANDS = ["spt3g220", "spt3g150", "spt3g90"] + TOGGLE_BANDS
+CONTACT_SHEET_MAX_SOURCES = int(os.getenv('SPT3G_VIEWER_CONTACT_SHEET_MAX_SOURCES', '300'))
+# Tile size in pixels; each sprite sheet holds COLUMNS x ROWS tiles
+CONTACT_SHEET_TILE_PX = int(os.getenv('SPT3G_VIEWER_CONTACT_SHEET_TILE_PX', '128'))
+CONTACT_SHEET_COLUMNS = int(os.getenv('SPT3G_VIEWER_CONTACT_SHEET_COLUMNS', '10'))
+CONTACT_SHEET_ROWS = int(os.getenv('SPT3G_VIEWER_CONTACT_SHEET_ROWS', '10'))
+CONTACT_SHEET_QUALITY = int(os.getenv('SPT3G_VIEWER_CONTACT_SHEET_QUALITY', '85'))
+# Threads decoding and scaling cutouts while a sheet is built
+CONTACT_SHEET_WORKERS = int(os.getenv('SPT3G_VIEWER_CONTACT_SHEET_WORKERS', str(min(8, os.cpu_count() or 1))))
+
+# Slider key -> catalog column, shared by the home page filters and the export route
+RANGE_FILTERS = {
+    "redshift": "z",
+    "s220": "spt3g_s220(mjy)",
+    "s150": "spt3g_s150(mjy)",
+    "a90": "spt3g_alpha90",
+    "a220": "spt3g_alpha220",
+    "tdust": "t_dust(k)",
+    "lir": "log_lir(lsun)",
+}
+
+# Slider step per filter; the slider bounds themselves are derived from the catalog
+SLIDER_STEPS = {
+    "redshift": 0.1,
+    "s220": 0.05,
+    "s150": 0.05,
+    "a90": 0.05,
+    "a220": 0.05,
+    "tdust": 1,
+    "lir": 0.1,
+}
+HISTOGRAM_BINS = 40
+
+# === Contours (see contours.py) ===
+# Draw the SPT3G 220GHz contours as vectors over contour-free {source}_image.png cutouts, instead of showing
+# the {source}_overlay.png cutouts that have the contours burned in
+VECTOR_CONTOURS = os.getenv('SPT3G_VIEWER_VECTOR_CONTOURS', 'false').lower() == 'true'
+BASE_IMAGE_SUFFIX = "image"
+CUTOUT_SUFFIX = BASE_IMAGE_SUFFIX if VECTOR_CONTOURS else "overlay"
+CONTOUR_BAND = "spt3g220"
+# Contour levels in units of the cutout noise, and those shown when a viewer page opens
+CONTOUR_LEVELS_SIGMA = [float(level) for level in os.getenv('SPT3G_VIEWER_CONTOUR_LEVELS', "3,5,10,20,40").split(",")]
+CONTOUR_DEFAULT_LEVELS = [float(level) for level in
+                          os.getenv('SPT3G_VIEWER_CONTOUR_DEFAULT_LEVELS', "5,10,20,40").split(",")]
+
+# Per-source asset folders (under assets/{mode}/) and their file suffixes
+ASSET_MODES = ["native", "convolved"]
+ASSET_FOLDERS = {
+    "mk": CUTOUT_SUFFIX,
+    "spt3g220": CUTOUT_SUFFIX,
+    "spt3g150": CUTOUT_SUFFIX,
+    "spt3g90": CUTOUT_SUFFIX,
+    "spire500": CUTOUT_SUFFIX,
+    "spire350": CUTOUT_SUFFIX,
+    "spire250": CUTOUT_SUFFIX,
+    "best_fit_plots": "best-fit",
+    "corner_plots": "corner",
+}
+
+# === Pixel probe (see probe.py) ===
+# FITS cutouts behind the PNGs, laid out as {CUTOUT_FITS_ROOT}/{asset_root}{mode}/{band}/{source_name}.fits
+CUTOUT_FITS_ROOT = os.getenv('SPT3G_VIEWER_CUTOUT_FITS_ROOT', FILE_PREFIX + "assets/fits")
+# Extension holding a noise map; without one the noise is estimated from a PROBE_NOISE_BOX pixel box
+PROBE_NOISE_EXTENSION = os.getenv('SPT3G_VIEWER_PROBE_NOISE_EXTENSION', "NOISE")
+PROBE_NOISE_BOX = int(os.getenv('SPT3G_VIEWER_PROBE_NOISE_BOX', '15'))
+PROBE_MAX_POSITIONS = int(os.getenv('SPT3G_VIEWER_PROBE_MAX_POSITIONS', '441'))
+# Memory-mapped cutouts kept open, per worker
+PROBE_CACHE_FILES = int(os.getenv('SPT3G_VIEWER_PROBE_CACHE_FILES', '256'))
+
+# === Beam convolution of the "convolved" asset tree (see convolve_assets.py) ===
+# Native beam FWHM of each band, in arcsec, and the SPT beam the convolved tree is smoothed to
+BEAM_FWHM_ARCSEC = {
+    "mk": 7.6,
+    "spire250": 18.1,
+    "spire350": 25.2,
+    "spire500": 36.6,
+    "spt3g220": 66.0,
+    "spt3g150": 72.0,
+    "spt3g90": 96.0,
+}
+CONVOLVED_BEAM_FWHM_ARCSEC = float(os.getenv('SPT3G_VIEWER_CONVOLVED_BEAM_FWHM_ARCSEC', '96'))
+
+# === Callback payloads (see payloads.py) ===
+# Response encodings offered to clients, in order of preference, and the Brotli level (0-11)
+COMPRESS_ALGORITHM = os.getenv('SPT3G_VIEWER_COMPRESS_ALGORITHM', "br,gzip").split(",")
+COMPRESS_BR_LEVEL = int(os.getenv('SPT3G_VIEWER_COMPRESS_BR_LEVEL', '4'))
+# Log the JSON and compressed size of every callback response, per output component
+PAYLOAD_LOGGING = os.getenv('SPT3G_VIEWER_PAYLOAD_LOGGING', 'false').lower() == 'true'
+
+# === Asset URL signing ===
+# "off" serves plain /assets URLs, "hmac" and "nginx" emit signed, expiring URLs (see signing.py)
+ASSET_URL_SIGNING = os.getenv('SPT3G_VIEWER_ASSET_URL_SIGNING', "off").lower()
+ASSET_URL_SECRET = os.getenv('SPT3G_VIEWER_ASSET_URL_SECRET', SECRET_KEY)
+ASSET_URL_TTL = int(os.getenv('SPT3G_VIEWER_ASSET_URL_TTL', str(4 * 3600)))
+ASSET_URL_TTL_BUCKET = int(os.getenv('SPT3G_VIEWER_ASSET_URL_TTL_BUCKET', '3600'))
+
+# === Export ===
+EXPORT_MAX_SOURCES = int(os.getenv('SPT3G_VIEWER_EXPORT_MAX_SOURCES', '5000'))
+EXPORT_MAX_BYTES = int(os.getenv('SPT3G_VIEWER_EXPORT_MAX_BYTES', str(4 * 1024**3)))
+EXPORT_CHUNK_SIZE = 1024**2
+
+# Seconds between checks for changed catalog, map and notes files; 0 disables hot reloading
+RELOAD_INTERVAL = int(os.getenv('SPT3G_VIEWER_RELOAD_INTERVAL', '30'))
+
+# === Background jobs ===
+JOB_CACHE_DIR = os.getenv('SPT3G_VIEWER_JOB_CACHE_DIR', "job_cache")
+JOB_RESULTS_DIR = os.path.join(JOB_CACHE_DIR, "results")
+JOB_CACHE_EXPIRE = int(os.getenv('SPT3G_VIEWER_JOB_CACHE_EXPIRE', str(24 * 3600)))
+JOB_POLL_INTERVAL = int(os.getenv('SPT3G_VIEWER_JOB_POLL_INTERVAL', '1000'))
@@ -0,0 +1,112 @@
+"""
+Contact sheets: one band's cutouts of many sources composited into a few JPEG sprite sheets, plus the tile
+rectangle of every source for an HTML image map, so a whole selection loads in a handful of requests.
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageDraw, ImageOps
+
+from config import (
+    ASSET_FOLDERS, CONTACT_SHEET_TILE_PX, CONTACT_SHEET_COLUMNS, CONTACT_SHEET_ROWS,
+    CONTACT_SHEET_WORKERS, CONTACT_SHEET_QUALITY
+)
+from jobs import job_result_path
+from cutouts import cutout_png_path, cutout_suffix
+
+TILE_BACKGROUND = (34, 34, 34)
+# Background pixels left between neighbouring tiles
+TILE_GAP = 2
+
+
+def contact_sheet_key(source_names, band, mode, version):
+    """
+    Cache key of the sheets of a selection: the ordered source names (the result of the filter state),
+    the band, the resolution mode and the data version.
+    """
+    state = json.dumps([list(source_names), band, mode, version], default=str)
+    return hashlib.sha1(state.encode("utf-8")).hexdigest()
+
+
+def cutout_path(source_name, band, mode="native", asset_root=""):
+    suffix = cutout_suffix(source_name, band, ASSET_FOLDERS[band], mode, asset_root)
+    return cutout_png_path(source_name, band, suffix, mode, asset_root)
+
+
+def load_tile(path, tile_px=CONTACT_SHEET_TILE_PX):
+    """
+    Cutout at path scaled to fit a tile_px square less TILE_GAP, or None if it is missing or unreadable.
+    """
+    try:
+        with Image.open(path) as img:
+            img.draft("RGB", (tile_px, tile_px))
+            tile = img.convert("RGB")
+    except OSError:
+        return None
+    return ImageOps.contain(tile, (tile_px - TILE_GAP, tile_px - TILE_GAP))
+
+
+def build_contact_sheets(source_names, band, mode="native", asset_root="", key=None, progress=None):
+    """
+    Composite the band's cutouts of source_names, in order, into sheets of CONTACT_SHEET_COLUMNS x
+    CONTACT_SHEET_ROWS tiles. Cutouts are decoded and scaled in a pool of CONTACT_SHEET_WORKERS threads.
+
+    The sheets and their manifest are written to the job results directory under key, and an existing
+    complete set is reused.
+
+    Parameters:
+    - source_names: ordered list of source names
+    - band: cutout folder, e.g. "spt3g220" or one of TOGGLE_BANDS
+    - key: cache key from contact_sheet_key
+    - progress: called with (tiles done, total tiles)
+
+    Returns:
+    - list of sheets, each {"name": file name, "width", "height", "tiles": [[source_name, x0, y0, x1, y1], ...]}
+    """
+    manifest_path = job_result_path(f"{key}.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            sheets = json.load(f)
+        if all(os.path.exists(job_result_path(sheet["name"])) for sheet in sheets):
+            return sheets
+
+    tile_px = CONTACT_SHEET_TILE_PX
+    per_sheet = CONTACT_SHEET_COLUMNS * CONTACT_SHEET_ROWS
+    paths = [cutout_path(source_name, band, mode, asset_root) for source_name in source_names]
+
+    sheets = []
+    with ThreadPoolExecutor(max_workers=CONTACT_SHEET_WORKERS) as pool:
+        # map keeps the input order and decodes ahead while earlier tiles are pasted
+        tiles = pool.map(load_tile, paths)
+        for start in range(0, len(source_names), per_sheet):
+            names = source_names[start:start + per_sheet]
+            columns = min(len(names), CONTACT_SHEET_COLUMNS)
+            rows = -(-len(names) // CONTACT_SHEET_COLUMNS)
+            sheet = Image.new("RGB", (columns * tile_px, rows * tile_px), TILE_BACKGROUND)
+            draw = ImageDraw.Draw(sheet)
+            rects = []
+            for i, source_name in enumerate(names):
+                x0, y0 = (i % CONTACT_SHEET_COLUMNS) * tile_px, (i // CONTACT_SHEET_COLUMNS) * tile_px
+                tile = next(tiles)
+                if tile is None:
+                    draw.text((x0 + 8, y0 + tile_px // 2), "missing", fill=(128, 128, 128))
+                else:
+                    sheet.paste(tile, (x0 + (tile_px - tile.width) // 2, y0 + (tile_px - tile.height) // 2))
+                rects.append([source_name, x0, y0, x0 + tile_px, y0 + tile_px])
+
+            name = f"{key}_{len(sheets)}.jpg"
+            tmp_path = f"{job_result_path(name)}.{os.getpid()}.tmp"
+            sheet.save(tmp_path, "JPEG", quality=CONTACT_SHEET_QUALITY)
+            os.replace(tmp_path, job_result_path(name))
+            sheets.append({"name": name, "width": sheet.width, "height": sheet.height, "tiles": rects})
+            if progress is not None:
+                progress(start + len(names), len(source_names))
+
+    # The manifest goes last, so a present manifest always describes complete sheets
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(sheets, f)
+    os.replace(tmp_path, manifest_path)
+    return sheets
@@ -0,0 +1,289 @@
+"""
+Vector contours of the SPT3G 220GHz cutouts, drawn by the viewer over contour-free base images.
+
+Contours are traced once per source and resolution mode (marching squares, at CONTOUR_LEVELS_SIGMA times the
+cutout noise) and stored as SVG path strings in fractional image coordinates (0-1, y down). Every other band's
+cutout of the source is checked against the 220GHz footprint through the WCS: bands on the same footprint are
+listed under "bands" and share those paths, bands on a different one get the contours reprojected into their
+own cutout under "band_paths", and bands without a FITS cutout or celestial WCS get no contours. Changing levels
+or colours is then a data update, not a re-render of the image tree.
+
+    assets/{asset_root}{mode}/contours/{source_name}.json
+
+With --images the contour-free native base images ({source_name}_image.png) are rendered from the native FITS
+cutouts of every band too; convolve_assets.py renders the convolved ones.
+
+Usage:
+    python contours.py [--field ssdf] [--images] [--force]
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from astropy.io import fits
+from astropy.wcs import WCS
+from contourpy import contour_generator, LineType
+
+from config import (
+    FILE_PREFIX, FIELDS, DEFAULT_FIELD, ASSET_MODES, CUTOUT_FITS_ROOT, BASE_IMAGE_SUFFIX, BEAM_FWHM_ARCSEC,
+    CONTOUR_BAND, CONTOUR_LEVELS_SIGMA
+)
+from probe import MAD_TO_SIGMA
+
+# Line colour of each level, lowest first
+CONTOUR_COLORS = ["#ffffff", "#ffe14d", "#ffa600", "#ff5c39", "#ff2bd6", "#9b5cff"]
+# Vertices closer than this (in fractional image coordinates) to the previous one are dropped
+SIMPLIFY_TOLERANCE = 0.002
+# Largest offset (in fractional image coordinates) of a band's footprint from the 220GHz one that still counts
+# as the same footprint
+FOOTPRINT_TOLERANCE = 0.005
+
+
+def level_key(level):
+    # Same text as String(level) in the browser: 5.0 -> "5", 2.5 -> "2.5"
+    return f"{level:g}"
+
+
+def contours_path(source_name, mode="native", asset_root=""):
+    return FILE_PREFIX + f"assets/{asset_root}{mode}/contours/{source_name}.json"
+
+
+def load_contours(source_name, asset_root=""):
+    """
+    Stored contours of a source for the viewer's contour-data store.
+
+    Returns:
+    - dict with "colors" (level key -> colour) and, per resolution mode, the contour file contents or None
+    """
+    data = {"colors": {level_key(level): CONTOUR_COLORS[i % len(CONTOUR_COLORS)]
+                       for i, level in enumerate(CONTOUR_LEVELS_SIGMA)}}
+    for mode in ASSET_MODES:
+        try:
+            with open(contours_path(source_name, mode, asset_root)) as f:
+                data[mode] = json.load(f)
+        except (OSError, ValueError):
+            data[mode] = None
+            continue
+        # Files written before the footprint check only apply to the 220GHz cutout itself
+        data[mode].setdefault("bands", [CONTOUR_BAND])
+        data[mode].setdefault("band_paths", {})
+    return data
+
+
+def _fractional(pixels, nx, ny):
+    # FITS pixel centres to fractional image coordinates, y down as in the PNGs
+    return (pixels[:, 0] + 0.5) / nx, 1 - (pixels[:, 1] + 0.5) / ny
+
+
+def _svg_path(line, nx, ny):
+    fx, fy = _fractional(line, nx, ny)
+    keep = [0]
+    for i in range(1, len(fx)):
+        if abs(fx[i] - fx[keep[-1]]) + abs(fy[i] - fy[keep[-1]]) >= SIMPLIFY_TOLERANCE:
+            keep.append(i)
+    if keep[-1] != len(fx) - 1:
+        keep.append(len(fx) - 1)
+    if len(keep) < 2:
+        return ""
+    points = " ".join(f"{fx[i]:.3f} {fy[i]:.3f}" for i in keep)
+    return f"M{points}"
+
+
+def _paths(lines, nx, ny):
+    return {key: [path for path in (_svg_path(line, nx, ny) for line in level_lines) if path]
+            for key, level_lines in lines.items()}
+
+
+def trace_lines(data, levels_sigma=CONTOUR_LEVELS_SIGMA):
+    """
+    Marching-squares contours of a 2-D map at levels_sigma times its noise (scaled MAD).
+
+    Returns:
+    - noise and dict of level key -> list of (n, 2) arrays of pixel positions (x, y) along each contour line
+    """
+    data = np.asarray(data, dtype=np.float64)
+    finite = data[np.isfinite(data)]
+    noise = MAD_TO_SIGMA * float(np.median(np.abs(finite - np.median(finite)))) if finite.size else 0.0
+
+    generator = contour_generator(z=np.ma.masked_invalid(data), line_type=LineType.Separate)
+    return noise, {level_key(level): generator.lines(level * noise) if noise > 0 else [] for level in levels_sigma}
+
+
+def trace_contours(data, levels_sigma=CONTOUR_LEVELS_SIGMA):
+    """
+    Contours of trace_lines as SVG paths over the map's own image.
+
+    Returns:
+    - dict with "noise", "levels" (absolute contour levels) and "paths" (level key -> list of SVG path strings)
+    """
+    ny, nx = np.shape(data)
+    noise, lines = trace_lines(data, levels_sigma)
+    return {"noise": noise, "levels": [level * noise for level in levels_sigma], "paths": _paths(lines, nx, ny)}
+
+
+def _footprint(header):
+    # Celestial WCS and image size of a cutout header, or None without a celestial WCS
+    wcs = WCS(header)
+    if not wcs.has_celestial:
+        return None
+    return wcs.celestial, header["NAXIS1"], header["NAXIS2"]
+
+
+def _to_band(pixels, footprint, band_footprint):
+    # Pixel positions in the 220GHz cutout to pixel positions in another band's cutout, through the sky
+    wcs, _, _ = footprint
+    band_wcs, _, _ = band_footprint
+    ra, dec = wcs.wcs_pix2world(pixels[:, 0], pixels[:, 1], 0)
+    x, y = band_wcs.wcs_world2pix(ra, dec, 0)
+    return np.column_stack([x, y])
+
+
+def same_footprint(footprint, band_footprint, tolerance=FOOTPRINT_TOLERANCE):
+    """
+    Whether a band's cutout covers the same sky as the 220GHz one, image corner for image corner, so that
+    contours in fractional image coordinates line up on both.
+    """
+    _, nx, ny = footprint
+    _, band_nx, band_ny = band_footprint
+    xs, ys = np.meshgrid([-0.5, (nx - 1) / 2, nx - 0.5], [-0.5, (ny - 1) / 2, ny - 0.5])
+    probes = np.column_stack([xs.ravel(), ys.ravel()])
+    with np.errstate(invalid="ignore"):
+        offsets = np.subtract(_fractional(_to_band(probes, footprint, band_footprint), band_nx, band_ny),
+                              _fractional(probes, nx, ny))
+    return bool(np.all(np.abs(offsets) <= tolerance))
+
+
+def _reproject(lines, footprint, band_footprint):
+    # Contour lines of the 220GHz cutout as SVG paths over another band's cutout
+    _, band_nx, band_ny = band_footprint
+    band_lines = {}
+    for key, level_lines in lines.items():
+        band_lines[key] = []
+        for line in level_lines:
+            band_line = _to_band(line, footprint, band_footprint)
+            band_line = band_line[np.isfinite(band_line).all(axis=1)]
+            if len(band_line):
+                band_lines[key].append(band_line)
+    return _paths(band_lines, band_nx, band_ny)
+
+
+def _image_hdu(hdul):
+    return next(hdu for hdu in hdul if hdu.is_image and hdu.header.get("NAXIS", 0) >= 2)
+
+
+def _plane(data):
+    while data.ndim > 2:
+        data = data[0]
+    return data
+
+
+def band_fits_paths(fits_path):
+    """
+    FITS cutouts of the other bands of the same source and mode as a 220GHz cutout, by band (existing files only).
+    """
+    source_dir, filename = os.path.split(fits_path)
+    mode_dir = os.path.dirname(source_dir)
+    paths = {band: os.path.join(mode_dir, band, filename) for band in BEAM_FWHM_ARCSEC if band != CONTOUR_BAND}
+    return {band: path for band, path in paths.items() if os.path.exists(path)}
+
+
+def build_source_contours(fits_path, out_path):
+    with fits.open(fits_path, memmap=True) as hdul:
+        hdu = _image_hdu(hdul)
+        data = _plane(hdu.data)
+        footprint = _footprint(hdu.header)
+        noise, lines = trace_lines(data)
+    ny, nx = data.shape
+    contours = {"noise": noise, "levels": [level * noise for level in CONTOUR_LEVELS_SIGMA],
+                "paths": _paths(lines, nx, ny), "bands": [CONTOUR_BAND], "band_paths": {}}
+
+    for band, band_path in band_fits_paths(fits_path).items():
+        with fits.open(band_path, memmap=True) as band_hdul:
+            band_footprint = _footprint(_image_hdu(band_hdul).header)
+        if footprint is None or band_footprint is None:
+            continue
+        if same_footprint(footprint, band_footprint):
+            contours["bands"].append(band)
+        else:
+            contours["band_paths"][band] = _reproject(lines, footprint, band_footprint)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(contours, f, separators=(",", ":"))
+    os.replace(tmp_path, out_path)
+
+
+def _run_task(task):
+    kind, in_path, out_path = task
+    try:
+        if kind == "contours":
+            build_source_contours(in_path, out_path)
+        else:
+            from convolve_assets import render_png
+            render_png(in_path, out_path)
+        return in_path, None
+    except Exception as error:
+        return in_path, error
+
+
+def _stale(in_path, out_path, other_paths=()):
+    if not os.path.exists(out_path):
+        return True
+    return os.path.getmtime(out_path) < max(os.path.getmtime(path) for path in [in_path, *other_paths])
+
+
+def plan_tasks(field, images=False, force=False):
+    """
+    Contour files (and with images, native base images) to (re)build for a field's FITS cutouts. A contour file
+    is stale when the 220GHz cutout or any other band's cutout of the source is newer.
+    """
+    asset_root = FIELDS[field]["asset_root"]
+    tasks = []
+    for mode in ASSET_MODES:
+        fits_dir = os.path.join(CUTOUT_FITS_ROOT, f"{asset_root}{mode}", CONTOUR_BAND)
+        for filename in sorted(os.listdir(fits_dir)) if os.path.isdir(fits_dir) else []:
+            if filename.endswith(".fits"):
+                in_path = os.path.join(fits_dir, filename)
+                out_path = contours_path(filename[:-len(".fits")], mode, asset_root)
+                if force or _stale(in_path, out_path, band_fits_paths(in_path).values()):
+                    tasks.append(("contours", in_path, out_path))
+
+    if images:
+        for band in BEAM_FWHM_ARCSEC:
+            fits_dir = os.path.join(CUTOUT_FITS_ROOT, f"{asset_root}native", band)
+            for filename in sorted(os.listdir(fits_dir)) if os.path.isdir(fits_dir) else []:
+                if filename.endswith(".fits"):
+                    in_path = os.path.join(fits_dir, filename)
+                    source_name = filename[:-len(".fits")]
+                    out_path = FILE_PREFIX + f"assets/{asset_root}native/{band}/{source_name}_{BASE_IMAGE_SUFFIX}.png"
+                    if force or _stale(in_path, out_path):
+                        tasks.append(("image", in_path, out_path))
+    return tasks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--field", default=DEFAULT_FIELD, choices=list(FIELDS))
+    parser.add_argument("--images", action="store_true", help="also render the contour-free native base images")
+    parser.add_argument("--force", action="store_true", help="rebuild outputs that are up to date")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    args = parser.parse_args(argv)
+
+    tasks = plan_tasks(args.field, args.images, args.force)
+    failed = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for in_path, error in pool.map(_run_task, tasks, chunksize=16):
+            if error is not None:
+                failed.append(in_path)
+                print(f"FAILED   {in_path}: {error}", file=sys.stderr)
+
+    n_contours = sum(kind == "contours" for kind, _, _ in tasks)
+    print(f"{n_contours} contour files and {len(tasks) - n_contours} base images written, {len(failed)} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
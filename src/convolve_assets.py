@@ -0,0 +1,337 @@
+"""
+Build the "convolved" asset tree: smooth native-resolution FITS cutouts (or whole maps) to the SPT beam and
+render them into the same folder layout as the native PNGs.
+
+Each band is convolved with a Gaussian of FWHM sqrt(target^2 - native^2) (config.BEAM_FWHM_ARCSEC and
+CONVOLVED_BEAM_FWHM_ARCSEC), or with a measured kernel given as a FITS image on the map's pixel grid.
+Convolution is done by FFT on tiles with a halo of the kernel radius, reading the input memory-mapped and
+writing into a memory-mapped output, so a map never has to fit in memory. Blank (NaN) pixels and the map edges
+are handled by normalized convolution. Maps in Jy/beam are rescaled to the target beam area.
+
+Cutouts are read from {CUTOUT_FITS_ROOT}/{asset_root}native/{band}/{source_name}.fits and written to
+.../convolved/{band}/{source_name}.fits, plus the contour-free
+assets/{asset_root}convolved/{band}/{source_name}_image.png (see contours.py for the contours); the
+{source_name}_overlay.png images with baked-in contours are never written. Existing outputs newer than their
+input are skipped unless --force is given.
+
+Usage:
+    python convolve_assets.py [--field ssdf] [--bands spire250,spire350] [--kernel spire250=psf250.fits]
+    python convolve_assets.py --map big_map_250.fits --out big_map_250_convolved.fits --band spire250
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from astropy.io import fits
+from astropy.visualization import simple_norm
+from astropy.wcs import WCS
+from astropy.wcs.utils import proj_plane_pixel_scales
+from PIL import Image
+from scipy.signal import fftconvolve
+
+from config import (
+    FILE_PREFIX, FIELDS, DEFAULT_FIELD, BASE_IMAGE_SUFFIX, CUTOUT_FITS_ROOT, BEAM_FWHM_ARCSEC,
+    CONVOLVED_BEAM_FWHM_ARCSEC
+)
+
+FWHM_TO_SIGMA = 1 / np.sqrt(8 * np.log(2))
+TILE_PX = 2048
+
+
+def image_hdu(hdul):
+    return next(hdu for hdu in hdul if hdu.is_image and hdu.header.get("NAXIS", 0) >= 2)
+
+
+def pixel_scale_arcsec(header):
+    return float(np.mean(proj_plane_pixel_scales(WCS(header).celestial))) * 3600
+
+
+def gaussian_kernel(fwhm_px):
+    """
+    Normalized 2-D Gaussian of the given FWHM in pixels, out to 4 sigma.
+    """
+    sigma = fwhm_px * FWHM_TO_SIGMA
+    radius = max(int(np.ceil(4 * sigma)), 1)
+    offsets = np.arange(-radius, radius + 1)
+    kernel = np.exp(-(offsets[:, None] ** 2 + offsets[None, :] ** 2) / (2 * sigma ** 2))
+    return kernel / kernel.sum()
+
+
+def band_kernel(band, header, measured=None):
+    """
+    Convolution kernel taking band from its native beam to CONVOLVED_BEAM_FWHM_ARCSEC on the pixel grid of
+    header, or None if the band is already at (or coarser than) the target beam.
+
+    Parameters:
+    - measured: optional path of a FITS kernel image, used instead of the Gaussian; it must have an odd number
+      of pixels along both axes, so its centre falls on a pixel
+    """
+    if measured:
+        with fits.open(measured) as hdul:
+            kernel = np.asarray(_plane(image_hdu(hdul).data), dtype=np.float64)
+        if kernel.shape[0] % 2 == 0 or kernel.shape[1] % 2 == 0:
+            raise ValueError(f"Kernel {measured} is {kernel.shape[1]} x {kernel.shape[0]} pixels; "
+                             "both sizes must be odd")
+        return kernel / kernel.sum()
+    native = BEAM_FWHM_ARCSEC[band]
+    if native >= CONVOLVED_BEAM_FWHM_ARCSEC:
+        return None
+    fwhm_arcsec = np.sqrt(CONVOLVED_BEAM_FWHM_ARCSEC ** 2 - native ** 2)
+    return gaussian_kernel(fwhm_arcsec / pixel_scale_arcsec(header))
+
+
+def plan_tiles(shape, tile=TILE_PX):
+    """
+    (y0, y1, x0, x1) bounds of the tiles covering an image of the given shape.
+    """
+    ny, nx = shape
+    return [(y0, min(y0 + tile, ny), x0, min(x0 + tile, nx))
+            for y0 in range(0, ny, tile) for x0 in range(0, nx, tile)]
+
+
+def convolve_region(data, bounds, kernel):
+    """
+    Normalized convolution of data with kernel, evaluated on bounds (y0, y1, x0, x1) only.
+
+    Reads bounds plus a halo of the kernel radius along each axis, so tiles computed separately match an
+    untiled result. NaN pixels stay NaN and are left out of their neighbours' sums.
+    """
+    y0, y1, x0, x1 = bounds
+    ny, nx = data.shape
+    halo_y, halo_x = kernel.shape[0] // 2, kernel.shape[1] // 2
+    ry0, ry1 = max(y0 - halo_y, 0), min(y1 + halo_y, ny)
+    rx0, rx1 = max(x0 - halo_x, 0), min(x1 + halo_x, nx)
+    region = np.asarray(data[ry0:ry1, rx0:rx1], dtype=np.float64)
+
+    finite = np.isfinite(region)
+    total = fftconvolve(np.where(finite, region, 0.0), kernel, mode="same")
+    weight = fftconvolve(finite.astype(np.float64), kernel, mode="same")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = total / weight
+    result[~finite] = np.nan
+    return result[y0 - ry0:y1 - ry0, x0 - rx0:x1 - rx0]
+
+
+def output_header(header, shape, band, measured=None):
+    """
+    Primary header of a convolved image: the celestial WCS and unit of the input, the new beam and float32 data.
+    """
+    out = fits.PrimaryHDU().header
+    out["BITPIX"] = -32
+    out["NAXIS"] = 2
+    out["NAXIS1"] = shape[1]
+    out["NAXIS2"] = shape[0]
+    out.update(WCS(header).celestial.to_header())
+    if "BUNIT" in header:
+        out["BUNIT"] = header["BUNIT"]
+    out["BMAJ"] = out["BMIN"] = CONVOLVED_BEAM_FWHM_ARCSEC / 3600
+    history = f"Convolved from {BEAM_FWHM_ARCSEC[band]} to {CONVOLVED_BEAM_FWHM_ARCSEC} arcsec FWHM"
+    if measured:
+        history += f" with kernel {os.path.basename(measured)}"
+    out["HISTORY"] = history
+    return out
+
+
+def create_output(path, header):
+    """
+    Write header and room for its data without holding the data in memory.
+
+    Returns:
+    - offset of the data in the file, for np.memmap
+    """
+    header_bytes = header.tostring().encode("ascii")
+    n_bytes = header["NAXIS1"] * header["NAXIS2"] * 4
+    with open(path, "wb") as f:
+        f.write(header_bytes)
+        # FITS files are padded to 2880-byte blocks
+        f.seek(len(header_bytes) + -(-n_bytes // 2880) * 2880 - 1)
+        f.write(b"\0")
+    return len(header_bytes)
+
+
+def beam_area_scale(header, band):
+    # Jy/beam maps keep their surface brightness per beam, so they scale with the beam area
+    if "beam" in str(header.get("BUNIT", "")).lower():
+        return (CONVOLVED_BEAM_FWHM_ARCSEC / BEAM_FWHM_ARCSEC[band]) ** 2
+    return 1.0
+
+
+def convolve_tiles(in_path, out_path, offset, tiles, kernel, scale):
+    """
+    Convolve the given tiles of in_path into the data of out_path (created by create_output). Tiles may be
+    split across processes, each writing its own part of the memory-mapped output.
+    """
+    with fits.open(in_path, memmap=True) as hdul:
+        data = _plane(image_hdu(hdul).data)
+        out = np.memmap(out_path, dtype=">f4", mode="r+", offset=offset, shape=data.shape)
+        for y0, y1, x0, x1 in tiles:
+            if kernel is None:
+                out[y0:y1, x0:x1] = data[y0:y1, x0:x1]
+            else:
+                out[y0:y1, x0:x1] = convolve_region(data, (y0, y1, x0, x1), kernel) * scale
+        out.flush()
+        del out
+    return len(tiles)
+
+
+def _plane(data):
+    while data.ndim > 2:
+        data = data[0]
+    return data
+
+
+def render_png(fits_path, png_path, stretch="linear", percent=95, cmap="gray"):
+    """
+    Render a FITS image to PNG, north up, with the stretch, clipping and colormap defaults of fits_to_png but
+    one PNG pixel per map pixel.
+    """
+    from matplotlib import colormaps
+
+    with fits.open(fits_path, memmap=True) as hdul:
+        data = np.asarray(_plane(image_hdu(hdul).data), dtype=np.float64)
+    finite = np.isfinite(data)
+    scaled = np.zeros_like(data)
+    if finite.any():
+        norm = simple_norm(data[finite], stretch=stretch, percent=percent)
+        scaled[finite] = np.clip(norm(data[finite]), 0, 1)
+    rgba = (colormaps[cmap](scaled[::-1]) * 255).astype(np.uint8)
+    os.makedirs(os.path.dirname(png_path), exist_ok=True)
+    Image.fromarray(rgba[..., :3]).save(png_path)
+
+
+def convolve_file(in_path, out_path, band, measured=None, tile=TILE_PX, png_path=None):
+    """
+    Convolve one FITS image to out_path (written to a temporary file and moved into place) and optionally
+    render it to png_path.
+    """
+    with fits.open(in_path, memmap=True) as hdul:
+        hdu = image_hdu(hdul)
+        header = hdu.header.copy()
+        shape = _plane(hdu.data).shape
+    kernel = band_kernel(band, header, measured)
+
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    offset = create_output(tmp_path, output_header(header, shape, band, measured))
+    convolve_tiles(in_path, tmp_path, offset, plan_tiles(shape, tile), kernel, beam_area_scale(header, band))
+    os.replace(tmp_path, out_path)
+    if png_path:
+        render_png(out_path, png_path)
+    return out_path
+
+
+def _convolve_task(task):
+    try:
+        convolve_file(**task)
+        return task["in_path"], None
+    except Exception as error:
+        return task["in_path"], error
+
+
+def cutout_tasks(field, bands, kernels, force=False, tile=TILE_PX):
+    """
+    One convolve_file task per native FITS cutout of the field whose convolved outputs are missing or stale.
+
+    Returns:
+    - list of task dicts, and the number of up-to-date cutouts skipped
+    """
+    asset_root = FIELDS[field]["asset_root"]
+    tasks, skipped = [], 0
+    for band in bands:
+        native_dir = os.path.join(CUTOUT_FITS_ROOT, f"{asset_root}native", band)
+        if not os.path.isdir(native_dir):
+            continue
+        for filename in sorted(os.listdir(native_dir)):
+            if not filename.endswith(".fits"):
+                continue
+            source_name = filename[:-len(".fits")]
+            in_path = os.path.join(native_dir, filename)
+            out_path = os.path.join(CUTOUT_FITS_ROOT, f"{asset_root}convolved", band, filename)
+            png_path = FILE_PREFIX + f"assets/{asset_root}convolved/{band}/{source_name}_{BASE_IMAGE_SUFFIX}.png"
+            mtime = os.path.getmtime(in_path)
+            if not force and all(os.path.exists(p) and os.path.getmtime(p) >= mtime for p in (out_path, png_path)):
+                skipped += 1
+                continue
+            tasks.append({"in_path": in_path, "out_path": out_path, "band": band, "measured": kernels.get(band),
+                          "tile": tile, "png_path": png_path})
+    return tasks, skipped
+
+
+def convolve_map(in_path, out_path, band, measured=None, tile=TILE_PX, workers=None):
+    """
+    Convolve one large map, spreading its tiles over a process pool.
+    """
+    with fits.open(in_path, memmap=True) as hdul:
+        hdu = image_hdu(hdul)
+        header = hdu.header.copy()
+        shape = _plane(hdu.data).shape
+    kernel = band_kernel(band, header, measured)
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    offset = create_output(tmp_path, output_header(header, shape, band, measured))
+    tiles = plan_tiles(shape, tile)
+    scale = beam_area_scale(header, band)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(convolve_tiles, in_path, tmp_path, offset, [bounds], kernel, scale)
+                   for bounds in tiles]
+        done = 0
+        for future in as_completed(futures):
+            done += future.result()
+            print(f"{done}/{len(tiles)} tiles", file=sys.stderr)
+    os.replace(tmp_path, out_path)
+
+
+def parse_kernels(items):
+    kernels = {}
+    for item in items or []:
+        band, path = item.split("=", 1)
+        kernels[band] = path
+    return kernels
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--field", default=DEFAULT_FIELD, choices=list(FIELDS))
+    parser.add_argument("--bands", default=",".join(BEAM_FWHM_ARCSEC),
+                        help="comma-separated bands to convolve (default: all bands in BEAM_FWHM_ARCSEC)")
+    parser.add_argument("--kernel", action="append", metavar="BAND=PATH",
+                        help="measured kernel FITS image for a band, on the map pixel grid; may be repeated")
+    parser.add_argument("--tile", type=int, default=TILE_PX, help="tile size in pixels")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--force", action="store_true", help="reprocess cutouts whose outputs are up to date")
+    parser.add_argument("--map", help="convolve this single map instead of the cutouts (needs --out and --band)")
+    parser.add_argument("--out", help="output FITS file of --map")
+    parser.add_argument("--band", help="band of --map")
+    args = parser.parse_args(argv)
+    kernels = parse_kernels(args.kernel)
+
+    if args.map:
+        if not args.out or args.band not in BEAM_FWHM_ARCSEC:
+            parser.error("--map needs --out and a --band from BEAM_FWHM_ARCSEC")
+        convolve_map(args.map, args.out, args.band, kernels.get(args.band), args.tile, args.workers)
+        print(f"wrote {args.out}")
+        return 0
+
+    bands = [band for band in args.bands.split(",") if band]
+    unknown = [band for band in bands if band not in BEAM_FWHM_ARCSEC]
+    if unknown:
+        parser.error(f"unknown bands: {', '.join(unknown)}")
+
+    tasks, skipped = cutout_tasks(args.field, bands, kernels, args.force, args.tile)
+    failed = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for done, (in_path, error) in enumerate(pool.map(_convolve_task, tasks, chunksize=8), start=1):
+            if error is not None:
+                failed.append(in_path)
+                print(f"FAILED   {in_path}: {error}", file=sys.stderr)
+            if done % 100 == 0:
+                print(f"convolved {done}/{len(tasks)} cutouts", file=sys.stderr)
+
+    print(f"{len(tasks) - len(failed)} cutouts convolved, {skipped} up to date, {len(failed)} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
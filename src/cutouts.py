@@ -0,0 +1,23 @@
+"""
+Locations of the per-source cutout PNGs, shared by the viewer, exports and contact sheets.
+"""
+import os
+
+from config import FILE_PREFIX, BASE_IMAGE_SUFFIX
+
+
+def cutout_png_path(source_name, folder, suffix, mode="native", asset_root=""):
+    return FILE_PREFIX + f"assets/{asset_root}{mode}/{folder}/{source_name}_{suffix}.png"
+
+
+def cutout_suffix(source_name, folder, suffix, mode="native", asset_root=""):
+    """
+    Suffix of the cutout PNG to show: suffix itself, unless that file is missing and the contour-free
+    {source_name}_{BASE_IMAGE_SUFFIX}.png exists. This is the case for the convolved cutouts that were never
+    shipped as overlay PNGs and are rendered by convolve_assets.py.
+    """
+    if suffix == BASE_IMAGE_SUFFIX or os.path.exists(cutout_png_path(source_name, folder, suffix, mode, asset_root)):
+        return suffix
+    if os.path.exists(cutout_png_path(source_name, folder, BASE_IMAGE_SUFFIX, mode, asset_root)):
+        return BASE_IMAGE_SUFFIX
+    return suffix
@@ -2,9 +2,15 @@ import numpy as np
 import pandas as pd
 import os
 import re
+import sys
+import threading
+from collections import OrderedDict
 from functools import lru_cache
 
-from config import FILE_PREFIX
+from flask import g, has_request_context
+
+from config import FIELDS, DEFAULT_FIELD, FIELD_CACHE_MAX_BYTES, NOTES_FILE, RANGE_FILTERS
+from sed import add_mbb_columns
 
 def join_avoiding_duplicates(df1, df2, key, how='inner'):
     """
@@ -26,41 +32,336 @@ def join_avoiding_duplicates(df1, df2, key, how='inner'):
 
     return df1.merge(df2[key + columns_to_use], on=key, how=how)
 
-@lru_cache(maxsize=1)
-def load_combined_catalog():
-    params = pd.read_csv(FILE_PREFIX+"assets/all_spt3g_sources_in_spire_field_20250519_no_NaNs.csv")
-    mbb = pd.read_csv(FILE_PREFIX+"assets/all_spt3g_sources_in_spire_field_20250519_no_NaNs_mbb_fit_params.csv")
-    return join_avoiding_duplicates(params, mbb, "source_name")
+# Columns kept at float64; everything else is only displayed to a few decimals and is stored as float32
+FULL_PRECISION_COLUMNS = ["spt3g_ra(deg)", "spt3g_dec(deg)"]
+
+# Display precision of the table columns, applied to the rows that are actually sent or exported
+TABLE_ROUNDING = {
+    "z": 4,
+    "spt3g_ra(deg)": 6,
+    "spt3g_dec(deg)": 6,
+    "spt3g_s220(mjy)": 2,
+    "spt3g_s150(mjy)": 2,
+    "spt3g_alpha90": 2,
+    "spt3g_alpha220": 2,
+    "t_dust(k)": 1,
+    "log_lir(lsun)": 2,
+}
+
+def compact_catalog(df):
+    """
+    Shrink a catalog DataFrame in place: categorical string columns and float32 for all floats
+    except FULL_PRECISION_COLUMNS.
+    """
+    for col in df.columns:
+        if pd.api.types.is_string_dtype(df[col]):
+            df[col] = df[col].astype("category")
+        elif df[col].dtype == np.float64 and col not in FULL_PRECISION_COLUMNS:
+            df[col] = df[col].astype(np.float32)
+    return df
+
+def sizeof(obj):
+    """
+    Approximate memory held by a cached value: DataFrames, numpy arrays and containers of them.
+    """
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(sizeof(k) + sizeof(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(sizeof(v) for v in obj)
+    return sys.getsizeof(obj)
+
+class FieldData:
+    """
+    Snapshot of one field's catalog plus values derived from it (histogram bins, lookup tables, ...).
+
+    A snapshot is immutable once built: new input files produce a new FieldData (see FieldCache.refresh).
+    Derived values are computed on first use through derived() and accounted for in nbytes.
+    """
+
+    def __init__(self, field):
+        self.field = field
+        self.config = FIELDS[field]
+        self.version = catalog_version(field)
+        params = pd.read_csv(self.config["catalog_csv"])
+        mbb = pd.read_csv(self.config["mbb_fit_csv"])
+        self.catalog = compact_catalog(add_mbb_columns(join_avoiding_duplicates(params, mbb, "source_name")))
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def derived(self, name, compute):
+        """
+        Return the derived value name, computing it with compute(self) on first use.
+        """
+        with self._lock:
+            if name not in self._derived:
+                self._derived[name] = compute(self)
+            return self._derived[name]
+
+    @property
+    def nbytes(self):
+        return sizeof(self.catalog) + sum(sizeof(value) for value in self._derived.values())
+
+class FieldCache:
+    """
+    LRU of FieldData bounded by total memory.
+
+    Fields are loaded on first request, outside the cache lock, so a cold load only holds up the requests for
+    that field. After each load the least recently used fields are evicted until the total is under
+    max_bytes; the most recently used field is always kept.
+
+    A forked child (e.g. a background job) gets fresh locks, as the parent's may have been held by another
+    thread at the time of the fork.
+    """
 
-@lru_cache(maxsize=1)
-def get_redshift_dict():
-    df = load_combined_catalog()
-    return {row["source_name"]: row["z"] for _, row in df.iterrows()}
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._fields = OrderedDict()
+        self._lock = threading.Lock()
+        # One lock per field, held while it loads, so concurrent first requests share one load
+        self._load_locks = {}
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        for data in self._fields.values():
+            data._lock = threading.Lock()
+
+    def _cached(self, field):
+        with self._lock:
+            if field in self._fields:
+                self._fields.move_to_end(field)
+                return self._fields[field]
+            return None
+
+    def get(self, field):
+        if field not in FIELDS:
+            raise KeyError(f"Unknown field {field!r}")
+        data = self._cached(field)
+        if data is not None:
+            return data
+        with self._lock:
+            load_lock = self._load_locks.setdefault(field, threading.Lock())
+        with load_lock:
+            # Another request may have loaded the field while this one waited
+            data = self._cached(field)
+            if data is not None:
+                return data
+            data = FieldData(field)
+            with self._lock:
+                self._fields[field] = data
+                self.evict()
+            return data
+
+    def refresh(self):
+        """
+        Rebuild the loaded fields whose input files changed and swap them in.
+
+        The new snapshot is built without holding the lock, then replaces the old one in a single
+        assignment. Requests already holding the old snapshot keep using it until they finish.
+        Returns the list of reloaded fields.
+        """
+        reloaded = []
+        # Snapshot under the lock: get() and evict() reorder and shrink the dict from request threads
+        with self._lock:
+            loaded = list(self._fields.items())
+        for field, data in loaded:
+            if catalog_version(field) == data.version:
+                continue
+            new_data = FieldData(field)
+            with self._lock:
+                if field in self._fields:
+                    self._fields[field] = new_data
+                    self.evict()
+                    reloaded.append(field)
+        return reloaded
+
+    def evict(self):
+        while len(self._fields) > 1 and self.total_bytes() > self.max_bytes:
+            self._fields.popitem(last=False)
+
+    def total_bytes(self):
+        return sum(data.nbytes for data in self._fields.values())
+
+    def report(self):
+        """
+        Memory held per loaded field, most recently used last.
+        """
+        with self._lock:
+            loaded = list(self._fields.items())
+        return {field: data.nbytes for field, data in loaded}
+
+field_cache = FieldCache(FIELD_CACHE_MAX_BYTES)
+
+def get_field_data(field=DEFAULT_FIELD):
+    """
+    Current snapshot of a field. Within a request the same snapshot is returned on every call, so a
+    reload landing mid-request cannot mix catalog versions.
+    """
+    field = field or DEFAULT_FIELD
+    if not has_request_context():
+        return field_cache.get(field)
+    pinned = g.setdefault("field_data", {})
+    if field not in pinned:
+        pinned[field] = field_cache.get(field)
+    return pinned[field]
+
+def load_combined_catalog(field=DEFAULT_FIELD):
+    return get_field_data(field).catalog
+
+def snapshot_version(field=DEFAULT_FIELD):
+    """
+    JSON-friendly version of the field's current snapshot, stored next to figures that carry row IDs.
+    """
+    return list(get_field_data(field).version)
+
+def source_name_for_row(row_id, version, field=DEFAULT_FIELD):
+    """
+    Source name for a catalog row ID, as sent in the map figure's customdata.
+
+    Row IDs are only meaningful in the snapshot that drew the figure: returns None if version (the
+    snapshot_version stored with the figure) is not the current snapshot's, or the row does not exist.
+    """
+    if version != snapshot_version(field):
+        return None
+    names = load_combined_catalog(field)["source_name"]
+    row_id = int(row_id)
+    return names.iat[row_id] if 0 <= row_id < len(names) else None
+
+def row_for_source(source_name, field=DEFAULT_FIELD):
+    """
+    Catalog row ID of a source, or None if the field has no such source.
+    """
+    lookup = get_field_data(field).derived(
+        "row_ids", lambda data: {name: i for i, name in enumerate(data.catalog["source_name"])}
+    )
+    return lookup.get(source_name)
+
+def file_version(paths):
+    return tuple(os.path.getmtime(p) if os.path.exists(p) else None for p in paths)
+
+def catalog_version(field):
+    """
+    Modification times of a field's catalog inputs; changes whenever one of them is rewritten.
+    """
+    return file_version([FIELDS[field]["catalog_csv"], FIELDS[field]["mbb_fit_csv"]])
+
+def data_version(field=None):
+    """
+    Catalog versions (of one field, or of all fields) plus the notes file modification time.
+    """
+    fields = [field] if field else list(FIELDS)
+    return tuple(catalog_version(f) for f in fields) + file_version([NOTES_FILE])
+
+def get_redshift_dict(field=DEFAULT_FIELD):
+    return get_field_data(field).derived(
+        "redshift_dict", lambda data: dict(zip(data.catalog["source_name"], data.catalog["z"]))
+    )
 
 def get_source_name(filename):
     return re.split(r"_[^_]+\.png$", filename)[0]
 
-@lru_cache(maxsize=None)
-def get_sorted_images(image_dir):
-    redshift_dict = get_redshift_dict()
+def get_sorted_images(image_dir, field=DEFAULT_FIELD):
+    # Keyed on the directory mtime and catalog snapshot, so new cutouts or a new catalog are picked up
+    data = get_field_data(field)
+    return _sorted_images(image_dir, os.path.getmtime(image_dir), data.field, data.version)
+
+@lru_cache(maxsize=64)
+def _sorted_images(image_dir, dir_mtime, field, version):
+    redshift_dict = get_redshift_dict(field)
     image_files = [
         f for f in os.listdir(image_dir)
         if f.endswith(".png") and get_source_name(f) in redshift_dict
     ]
     return sorted(image_files, key=get_source_name)
 
-def prepare_table_data(notes):
-    df = load_combined_catalog()
-    df = df[["source_name", "z", "spt3g_ra(deg)", "spt3g_dec(deg)", "spt3g_s220(mjy)", "spt3g_s150(mjy)",
-             "spt3g_alpha90", "spt3g_alpha220"]].copy()
-    df["z"] = df["z"].round(4)
-    df["spt3g_ra(deg)"] = df["spt3g_ra(deg)"].round(6)
-    df["spt3g_dec(deg)"] = df["spt3g_dec(deg)"].round(6)
-    df["spt3g_s220(mjy)"] = df["spt3g_s220(mjy)"].round(2)
-    df["spt3g_s150(mjy)"] = df["spt3g_s150(mjy)"].round(2)
-    df["spt3g_alpha90"] = df["spt3g_alpha90"].round(2)
-    df["spt3g_alpha220"] = df["spt3g_alpha220"].round(2)
-    df["has_note"] = np.array(df["source_name"].isin(notes.keys()), dtype=int)
+def prepare_table_data(notes, field=DEFAULT_FIELD):
+    """
+    Table columns of the catalog plus the has_note flag.
+
+    The column selection shares its buffers with the cached catalog (copy-on-write), so only has_note is
+    allocated per call. Values are unrounded; use round_table_data on the rows that are sent or exported.
+    The index is the catalog row ID.
+    """
+    df = load_combined_catalog(field)
+    df = df[["source_name", *TABLE_ROUNDING]]
+    df["has_note"] = df["source_name"].isin(list(notes)).to_numpy(dtype=np.int8)
+    return df
+
+def round_table_data(df):
+    """
+    Copy of (filtered) table rows with the display columns as rounded float64.
+    """
+    return df.assign(**{col: df[col].astype(np.float64).round(digits) for col, digits in TABLE_ROUNDING.items()})
+
+def filter_masks(df, search_text=None, ranges=None, note_matches=None):
+    """
+    Boolean row masks of the home page filters.
+
+    Returns:
+    - dict of filter key -> numpy bool array aligned with df; "search" for the name filter, "notes" for
+      the notes search and the slider keys of config.RANGE_FILTERS. Inactive filters are left out.
+    """
+    masks = {}
+    if search_text:
+        masks["search"] = df["source_name"].str.lower().str.contains(search_text.lower(), regex=False).to_numpy()
+    if note_matches is not None:
+        masks["notes"] = df["source_name"].isin(list(note_matches)).to_numpy()
+
+    for key, value in (ranges or {}).items():
+        column = RANGE_FILTERS[key]
+        if value and column in df.columns:
+            values = filter_values(df, column)
+            masks[key] = (values >= value[0]) & (values <= value[1])
+    return masks
+
+def filter_values(df, column):
+    """
+    A column as float64 rounded to its TABLE_ROUNDING display precision, the values the range filters compare.
+    The catalog stores float32, and e.g. float32(2.1) is below 2.1, so unrounded values at a slider bound would
+    fall out of a range that matches the value shown in the table.
+    """
+    values = df[column].to_numpy(dtype=np.float64)
+    return values.round(TABLE_ROUNDING[column]) if column in TABLE_ROUNDING else values
+
+def combine_masks(masks, n_rows, exclude=None):
+    """
+    AND of all masks except the one under key exclude.
+    """
+    combined = np.ones(n_rows, dtype=bool)
+    for key, mask in masks.items():
+        if key != exclude:
+            combined &= mask
+    return combined
+
+def filter_table_data(df, search_text=None, ranges=None, sort_by=None, note_matches=None):
+    """
+    Apply the home page filters to a table DataFrame.
+
+    Parameters:
+    - df: DataFrame from prepare_table_data
+    - search_text: case-insensitive substring of the source name
+    - ranges: dict of slider key (see config.RANGE_FILTERS) -> [min, max]
+    - sort_by: DataTable sort_by list of {"column_id", "direction"}
+    - note_matches: source names found by the notes search (NotesStore.search), or None for no notes filter
+
+    Returns:
+    - The filtered (and sorted) DataFrame
+    """
+    masks = filter_masks(df, search_text, ranges, note_matches)
+    if masks:
+        df = df[combine_masks(masks, len(df))]
+
+    if sort_by:
+        for sort in reversed(sort_by):
+            df = df.sort_values(by=sort["column_id"], ascending=(sort["direction"] == "asc"))
+
     return df
 
 def get_table_styles(theme):
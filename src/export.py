@@ -0,0 +1,156 @@
+import os
+import time
+import tarfile
+from urllib.parse import urlencode
+
+from config import (
+    FIELDS, DEFAULT_FIELD, RANGE_FILTERS, ASSET_MODES, ASSET_FOLDERS, EXPORT_CHUNK_SIZE, TABLE_COLUMNS
+)
+from cutouts import cutout_png_path, cutout_suffix
+
+TAR_BLOCK = 512
+
+
+def export_query_string(field, search_text, ranges, sort_by, modes=None, notes_query=None):
+    """
+    Encode the home page filter state as the query string understood by parse_export_args.
+    """
+    params = {"field": field}
+    if search_text:
+        params["search"] = search_text
+    if notes_query:
+        params["notes"] = notes_query
+    for key, value in (ranges or {}).items():
+        if value:
+            params[key] = f"{value[0]},{value[1]}"
+    if sort_by:
+        params["sort"] = ";".join(f"{sort['column_id']}:{sort['direction']}" for sort in sort_by)
+    if modes:
+        params["modes"] = ",".join(modes)
+    return urlencode(params)
+
+
+def parse_export_args(args):
+    """
+    Decode the export request query arguments.
+
+    Returns:
+    - field, search_text, ranges, sort_by, the list of asset modes to include and the notes search query
+    Raises ValueError for an unknown field, a malformed range or a sort on a column that is not in the table.
+    """
+    field = args.get("field", DEFAULT_FIELD)
+    if field not in FIELDS:
+        raise ValueError(f"Unknown field {field!r}")
+    search_text = args.get("search") or None
+
+    ranges = {}
+    for key in RANGE_FILTERS:
+        if args.get(key):
+            low, high = args[key].split(",")
+            ranges[key] = [float(low), float(high)]
+
+    sort_by = []
+    for item in filter(None, args.get("sort", "").split(";")):
+        column_id, direction = item.rsplit(":", 1)
+        if column_id not in {column["id"] for column in TABLE_COLUMNS} or direction not in ("asc", "desc"):
+            raise ValueError(f"Cannot sort by {item!r}")
+        sort_by.append({"column_id": column_id, "direction": direction})
+
+    modes = [mode for mode in args.get("modes", ",".join(ASSET_MODES)).split(",") if mode in ASSET_MODES]
+    return field, search_text, ranges, sort_by, modes, args.get("notes") or None
+
+
+def collect_export_files(source_names, modes, asset_root=""):
+    """
+    List the assets available for the given sources.
+
+    Returns:
+    - list of (archive name, local path, size in bytes); missing assets are skipped
+    """
+    files = []
+    for source_name in source_names:
+        for mode in modes:
+            for folder, suffix in ASSET_FOLDERS.items():
+                suffix = cutout_suffix(source_name, folder, suffix, mode, asset_root)
+                path = cutout_png_path(source_name, folder, suffix, mode, asset_root)
+                try:
+                    size = os.stat(path).st_size
+                except FileNotFoundError:
+                    continue
+                files.append((f"{source_name}/{mode}/{folder}/{source_name}_{suffix}.png", path, size))
+    return files
+
+
+def _padded(size):
+    return -(-size // TAR_BLOCK) * TAR_BLOCK
+
+
+def export_archive_size(table_bytes, files):
+    """
+    Exact size of the tar stream produced by iter_export_archive, used as Content-Length.
+    """
+    total = TAR_BLOCK + _padded(len(table_bytes))
+    for _, _, size in files:
+        total += TAR_BLOCK + _padded(size)
+    return total + 2 * TAR_BLOCK
+
+
+def _tar_header(name, size, mtime):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(mtime)
+    info.mode = 0o644
+    return info.tobuf(format=tarfile.USTAR_FORMAT)
+
+
+def iter_export_archive(table_name, table_bytes, files, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Generate an uncompressed tar archive chunk by chunk.
+
+    The catalog table goes first, followed by each asset file read in chunk_size pieces, so at most
+    one chunk is held in memory at a time. Files that vanish or change size mid-export are padded or
+    truncated to the size announced up front, keeping the stream consistent with export_archive_size.
+    """
+    yield _tar_header(table_name, len(table_bytes), time.time())
+    yield table_bytes + b"\0" * (_padded(len(table_bytes)) - len(table_bytes))
+
+    for name, path, size in files:
+        yield _tar_header(name, size, os.path.getmtime(path) if os.path.exists(path) else time.time())
+        remaining = size
+        try:
+            with open(path, "rb") as f:
+                while remaining > 0:
+                    chunk = f.read(min(chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+        except OSError:
+            pass
+        yield b"\0" * (remaining + _padded(size) - size)
+
+    yield b"\0" * (2 * TAR_BLOCK)
+
+
+def write_export_archive(path, table_name, table_bytes, files, progress=None, progress_interval=0.5):
+    """
+    Write the export tar to path, reporting (bytes written, total bytes) to progress at most every
+    progress_interval seconds.
+
+    The archive is written to a temporary file and moved into place, so a present file is always complete.
+    """
+    total = export_archive_size(table_bytes, files)
+    written = 0
+    last_report = 0.0
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as out:
+        for chunk in iter_export_archive(table_name, table_bytes, files):
+            out.write(chunk)
+            written += len(chunk)
+            if progress is not None and time.time() - last_report >= progress_interval:
+                progress(written, total)
+                last_report = time.time()
+    os.replace(tmp_path, path)
+    if progress is not None:
+        progress(total, total)
+    return total
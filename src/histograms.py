@@ -0,0 +1,107 @@
+import math
+
+import numpy as np
+import plotly.graph_objects as go
+
+from config import RANGE_FILTERS, SLIDER_STEPS, HISTOGRAM_BINS, DEFAULT_FIELD
+from data_loader import get_field_data, filter_masks, combine_masks, filter_values
+
+
+def get_slider_bins(field=DEFAULT_FIELD):
+    """
+    Slider bounds and marks, histogram bin edges and the precomputed bin index of every catalog row, per slider.
+
+    Rows with NaN values get the overflow index HISTOGRAM_BINS and are never counted. Sliders of columns
+    without any finite value (e.g. no MBB fit columns) have "available" False and a placeholder 0-step range.
+    """
+    return get_field_data(field).derived("slider_bins", _compute_slider_bins)
+
+
+def empty_filter_columns(field=DEFAULT_FIELD):
+    """
+    Catalog columns of the sliders that have no finite values in the field, to leave out of the page.
+    """
+    return {RANGE_FILTERS[key] for key, slider_bins in get_slider_bins(field).items() if not slider_bins["available"]}
+
+
+def _compute_slider_bins(data):
+    df = data.catalog
+    bins = {}
+    for key, column in RANGE_FILTERS.items():
+        step = SLIDER_STEPS[key]
+        values = filter_values(df, column) if column in df.columns else np.full(len(df), np.nan)
+        finite = values[np.isfinite(values)]
+        available = finite.size > 0
+        if available:
+            low = round(math.floor(finite.min() / step) * step, 6)
+            high = round(math.ceil(finite.max() / step) * step, 6)
+        else:
+            low, high = 0.0, float(step)
+        edges = np.linspace(low, high, HISTOGRAM_BINS + 1)
+        index = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, HISTOGRAM_BINS - 1)
+        index[~np.isfinite(values)] = HISTOGRAM_BINS
+        bins[key] = {"min": low, "max": high, "step": step, "marks": slider_marks(low, high),
+                     "edges": edges, "index": index.astype(np.int16), "available": available}
+    return bins
+
+
+def slider_marks(low, high, max_marks=9):
+    first, last = math.ceil(low), math.floor(high)
+    stride = max(1, math.ceil((last - first + 1) / max_marks))
+    return {i: str(i) for i in range(first, last + 1, stride)}
+
+
+def slider_histograms(df, search_text=None, ranges=None, field=DEFAULT_FIELD, note_matches=None):
+    """
+    Cross-filtered histogram counts for every slider.
+
+    Each slider's counts include the rows passing every other active filter, but not its own, so the
+    histogram shows where moving that slider would go. Counting is a bincount of the precomputed bin
+    indices under the combined mask.
+
+    Parameters:
+    - df: full, unfiltered DataFrame from prepare_table_data (catalog row order)
+    - search_text, ranges, note_matches: as for filter_table_data
+    - field: field of the catalog in df
+    """
+    masks = filter_masks(df, search_text, ranges, note_matches)
+    counts = {}
+    for key, slider_bins in get_slider_bins(field).items():
+        index = slider_bins["index"]
+        if masks:
+            index = index[combine_masks(masks, len(df), exclude=key)]
+        counts[key] = np.bincount(index, minlength=HISTOGRAM_BINS + 1)[:HISTOGRAM_BINS]
+    return counts
+
+
+def histogram_figure(key, counts, value=None, field=DEFAULT_FIELD):
+    """
+    Small bar chart to sit above a RangeSlider; bins inside the selected range are highlighted.
+    """
+    slider_bins = get_slider_bins(field)[key]
+    edges = slider_bins["edges"]
+    centers = (edges[:-1] + edges[1:]) / 2
+    if value:
+        in_range = (centers >= value[0]) & (centers <= value[1])
+    else:
+        in_range = np.ones(len(centers), dtype=bool)
+
+    fig = go.Figure(go.Bar(
+        x=centers,
+        y=counts,
+        width=edges[1] - edges[0],
+        marker_color=np.where(in_range, "#00FFAA", "rgba(128, 128, 128, 0.4)"),
+        hovertemplate="%{y}<extra></extra>"
+    ))
+    fig.update_layout(
+        # side margins line the bars up with the RangeSlider track
+        margin=dict(l=25, r=25, t=0, b=0),
+        height=60,
+        bargap=0.05,
+        showlegend=False,
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)",
+        xaxis=dict(visible=False, range=[slider_bins["min"], slider_bins["max"]]),
+        yaxis=dict(visible=False)
+    )
+    return fig
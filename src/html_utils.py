@@ -1,12 +1,23 @@
-from dash import html
+from dash import html, dcc
 
-def cutout_row(images, source_name, mode="native", row_style=None):
+from config import ASSET_MODES, CUTOUT_SUFFIX, VECTOR_CONTOURS
+from signing import sign_asset_url
+from cutouts import cutout_suffix
+
+def cutout_row(images, source_name, mode="native", row_style=None, asset_root=""):
     """
     images: list of dicts, each dict defines one panel.
             Required keys:
                 prefix, folder, suffix, title
             Optional keys:
-                img_style, fig_style, caption_style, width
+                img_style, fig_style, caption_style, width,
+                lazy (render without src; the viewer's clientside callback releases it as a
+                lazy, low-priority, async-decoded fetch after the first row),
+                content (component shown instead of an image; prefix, folder and suffix are then unused),
+                contours (with VECTOR_CONTOURS, draw the viewer's vector contours of the folder's band over the
+                image)
+    Each image carries the (signed) URL of every resolution mode as data-<mode>, for the
+    clientside resolution toggle.
     """
 
     default_row_style = {
@@ -20,28 +31,29 @@ def cutout_row(images, source_name, mode="native", row_style=None):
 
     figures = []
     for img in images:
-        prefix   = img["prefix"]
-        folder   = img["folder"]
-        suffix   = img["suffix"]
         title    = img["title"]
 
-
         # Optional overrides
         width          = img.get("width", f"{100/len(images)}%")
         fig_style      = img.get("fig_style", {"width": width, "textAlign": "center"})
         img_style      = img.get("img_style", {"width": "100%"})
         caption_style  = img.get("caption_style", {"fontSize": "25px"})
+        lazy           = img.get("lazy", False)
+
+        if "content" in img:
+            figures.append(html.Figure([img["content"], html.Figcaption(title, style=caption_style)],
+                                       style=fig_style))
+            continue
+
+        image = cutout_img(source_name, img["prefix"], img["folder"], img["suffix"], mode, asset_root, lazy,
+                           img_style)
+        if VECTOR_CONTOURS and img.get("contours"):
+            image = contour_overlay(image, f"{img['prefix']}_{source_name}", img["folder"])
 
         figures.append(
             html.Figure(
                 [
-                    html.Img(
-                        src=f"/assets/{mode}/{folder}/{source_name}_{suffix}.png",
-                        style=img_style,
-                        id={"type": "cutout_img", "index": f"{prefix}_{source_name}", "band": prefix,
-                            "folder": folder, "suffix": suffix},
-                        n_clicks=0
-                    ),
+                    image,
                     html.Figcaption(title, style=caption_style)
                 ],
                 style=fig_style
@@ -50,6 +62,82 @@ def cutout_row(images, source_name, mode="native", row_style=None):
 
     return html.Div(figures, style=row_style)
 
+def cutout_img(source_name, prefix, folder, suffix, mode="native", asset_root="", lazy=False, style=None):
+    """
+    One cutout image, with the id and data-<mode> URLs the viewer's clientside resolution toggle relies on.
+    prefix must not contain "_". Each mode's URL falls back to the contour-free image (see cutouts.cutout_suffix).
+    """
+    mode_suffixes = {m: cutout_suffix(source_name, folder, suffix, m, asset_root) for m in ASSET_MODES}
+    mode_srcs = {m: sign_asset_url(f"/assets/{asset_root}{m}/{folder}/{source_name}_{mode_suffix}.png")
+                 for m, mode_suffix in mode_suffixes.items()}
+    src = mode_srcs[mode]
+    src_props = {"data-src": src} if lazy else {"src": src}
+    src_props.update({f"data-{m}": mode_src for m, mode_src in mode_srcs.items()})
+
+    return html.Img(
+        style=style or {"width": "100%"},
+        id={"type": "cutout_img", "index": f"{prefix}_{source_name}", "band": prefix,
+            "folder": folder, "suffix": suffix, "root": asset_root},
+        n_clicks=0,
+        **src_props
+    )
+
+def contour_overlay(image, index, band):
+    """
+    The image with an empty SVG layered on top, whose src the viewer's contour callback fills in with the
+    contours traced for band (see contours.py). The layer ignores the pointer, so clicks still reach the image.
+    """
+    return html.Div([
+        image,
+        html.Img(
+            id={"type": "contour_overlay", "index": index, "band": band},
+            src="data:image/svg+xml,%3Csvg%20xmlns%3D%27http%3A%2F%2Fwww.w3.org%2F2000%2Fsvg%27%2F%3E",
+            alt="",
+            style={"position": "absolute", "top": 0, "left": 0, "width": "100%", "height": "100%",
+                   "pointerEvents": "none"}
+        )
+    ], style={"position": "relative", "lineHeight": 0})
+
+def similar_sources_row(sources, mode="native", asset_root="", folder="spt3g220", suffix=CUTOUT_SUFFIX):
+    """
+    Strip of lazily loaded thumbnails, each linking to the viewer page of that source.
+    sources: list of (source_name, caption)
+    """
+    figures = [
+        html.Figure(
+            [
+                dcc.Link(cutout_img(source_name, "similar", folder, suffix, mode, asset_root, lazy=True),
+                         href=f"/viewer/{source_name}"),
+                html.Figcaption([dcc.Link(source_name, href=f"/viewer/{source_name}"), html.Br(), caption],
+                                style={"fontSize": "14px"})
+            ],
+            style={"width": f"{100 / max(len(sources), 1)}%", "textAlign": "center"}
+        )
+        for source_name, caption in sources
+    ]
+    return html.Div(figures, style={"display": "flex", "gap": "1%", "justifyContent": "flex-start",
+                                    "marginBottom": "30px"})
+
+def contact_sheet_images(sheets):
+    """
+    Sprite sheets from contact_sheet.build_contact_sheets, each with an image map whose areas open the
+    viewer page of the source under the pointer. Sheets are shown at their natural size, which the
+    area coordinates refer to.
+    """
+    children = []
+    for i, sheet in enumerate(sheets):
+        map_name = f"contact-sheet-map-{i}"
+        children.append(html.Img(src=f"/contact-sheets/{sheet['name']}", useMap=f"#{map_name}",
+                                 width=sheet["width"], height=sheet["height"],
+                                 style={"display": "block", "maxWidth": "none", "marginBottom": "4px"}))
+        children.append(html.MapEl(
+            [html.Area(shape="rect", coords=f"{x0},{y0},{x1},{y1}", href=f"/viewer/{source_name}",
+                       alt=source_name, title=source_name)
+             for source_name, x0, y0, x1, y1 in sheet["tiles"]],
+            name=map_name
+        ))
+    return children
+
 def theme_toggle_button():
     return html.Button(
         "Toggle Light/Dark Mode",
@@ -58,3 +146,30 @@ def theme_toggle_button():
         # **{"aria-label": "Change theme"},
         style={"padding": "10px 20px", "margin": "20px"}
     )
+
+def range_filter(key, label, slider_bins):
+    """
+    Labelled RangeSlider with its distribution histogram above it.
+    key: slider key from config.RANGE_FILTERS; the components get ids {key}-hist and {key}-slider
+    slider_bins: bounds, step and marks from histograms.get_slider_bins; a slider that is not "available"
+    (no finite values in its column) is rendered hidden and inactive, so the filter callbacks still find it
+    """
+    available = slider_bins.get("available", True)
+    return html.Div([
+        html.Label(label),
+        dcc.Graph(
+            id=f"{key}-hist",
+            config={"displayModeBar": False, "staticPlot": True},
+            style={"height": "60px"}
+        ),
+        dcc.RangeSlider(
+            id=f"{key}-slider",
+            min=slider_bins["min"],
+            max=slider_bins["max"],
+            step=slider_bins["step"],
+            value=[slider_bins["min"], slider_bins["max"]] if available else None,
+            marks=slider_bins["marks"],
+            tooltip={"placement": "bottom", "always_visible": False},
+            allowCross=False
+        )
+    ], style={"flex": "1", "marginRight": "20px"} if available else {"display": "none"})
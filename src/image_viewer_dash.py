@@ -1,3 +1,4 @@
+import os
 import dash
 from dash import dcc, html, Input, Output, State, dash_table
 from dash.dependencies import ALL
@@ -7,8 +8,11 @@ from data_loader import (
     get_sorted_images,
     get_source_name,
     prepare_table_data,
+    filter_table_data,
+    round_table_data,
     load_combined_catalog,
-    get_table_styles
+    get_table_styles,
+    row_for_source
 )
 from config import (
     USERS, SECRET_KEY,
@@ -17,12 +21,26 @@ from config import (
     SERVER_HOST,
     SERVER_PORT,
     URL_BASE_PATHNAME,
+    EXPORT_MAX_SOURCES,
+    EXPORT_MAX_BYTES,
+    JOB_RESULTS_DIR,
+    JOB_CACHE_EXPIRE,
+    FIELDS,
+    DEFAULT_FIELD,
 )
+from export import parse_export_args, collect_export_files, export_archive_size, iter_export_archive
+from jobs import background_callback_manager
+from payloads import init_payload_encoding
+from probe import parse_probe_args, probe
 from layouts import home_layout, viewer_layout, notes
 from callbacks import register_callbacks
+from reloader import start_reload_watcher
+from signing import is_protected_asset, verify_asset_request, verify_asset_uri
 
 # === Flask + Flask-Login imports ===
-from flask import Flask, redirect, url_for, request, render_template_string
+from flask import (
+    Flask, Response, redirect, url_for, request, render_template_string, stream_with_context, send_from_directory
+)
 from flask_login import (
     LoginManager, UserMixin, login_user,
     login_required, logout_user
@@ -58,6 +76,29 @@ def unauthorized():
 with open("login_template.html") as f:
     login_html = f.read()
 
+@server.before_request
+def ensure_reload_watcher():
+    start_reload_watcher(notes)
+
+
+@server.before_request
+def check_asset_signature():
+    # Cutouts served by the app itself need a valid signed URL when signing is enabled
+    if is_protected_asset(request.path) and not verify_asset_request(request.path, request.args):
+        return "Invalid or expired asset URL", 403
+
+
+@server.route("/asset-auth")
+def asset_auth():
+    """
+    Signature check for a front proxy (nginx auth_request): 204 if the URI in X-Original-URI is valid.
+    Needs no session or user lookup.
+    """
+    if verify_asset_uri(request.headers.get("X-Original-URI", "")):
+        return "", 204
+    return "", 403
+
+
 @server.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
@@ -77,10 +118,82 @@ def logout():
     return redirect(url_for("login"))
 
 
+@server.route("/export")
+@login_required
+def export_selection():
+    """
+    Stream a tar of the filtered catalog rows (CSV) and the matching cutouts and corner plots.
+    """
+    try:
+        field, search_text, ranges, sort_by, modes, notes_query = parse_export_args(request.args)
+    except ValueError:
+        return "Invalid export parameters", 400
+
+    note_matches = notes.search(notes_query) if notes_query else None
+    df = filter_table_data(prepare_table_data(notes, field), search_text, ranges, sort_by, note_matches)
+    if len(df) > EXPORT_MAX_SOURCES:
+        return f"Export is limited to {EXPORT_MAX_SOURCES} sources ({len(df)} selected)", 413
+
+    table_bytes = round_table_data(df).to_csv(index=False).encode("utf-8")
+    files = collect_export_files(df["source_name"], modes, FIELDS[field]["asset_root"])
+    size = export_archive_size(table_bytes, files)
+    if size > EXPORT_MAX_BYTES:
+        return f"Export is limited to {EXPORT_MAX_BYTES} bytes ({size} requested)", 413
+
+    return Response(
+        stream_with_context(iter_export_archive("catalog.csv", table_bytes, files)),
+        mimetype="application/x-tar",
+        headers={
+            # Exact length so the browser can show download progress
+            "Content-Length": str(size),
+            "Content-Disposition": 'attachment; filename="spt3g_export.tar"',
+        }
+    )
+
+
+@server.route("/export/jobs/<name>")
+@login_required
+def export_job_result(name):
+    return send_from_directory(os.path.abspath(JOB_RESULTS_DIR), name, as_attachment=True,
+                               download_name="spt3g_export.tar")
+
+
+@server.route("/probe", methods=["GET", "POST"])
+@login_required
+def probe_pixels():
+    """
+    Map values, noise and sky coordinates under the cursor (see probe.parse_probe_args for the arguments).
+    """
+    args = (request.get_json(silent=True) or {}) if request.method == "POST" else request.args
+    try:
+        field, kwargs = parse_probe_args(args)
+        if row_for_source(kwargs["source_name"], field) is None:
+            return "Unknown source", 404
+        return probe(**kwargs)
+    except FileNotFoundError:
+        return "No FITS cutout for this source and band", 404
+    except (ValueError, TypeError):
+        return "Invalid probe parameters", 400
+
+
+@server.route("/contact-sheets/<name>")
+@login_required
+def contact_sheet_image(name):
+    # Names are content hashes of the selection, so the sheets can be cached for the job lifetime
+    if not name.endswith(".jpg"):
+        return "Not found", 404
+    response = send_from_directory(os.path.abspath(JOB_RESULTS_DIR), name, mimetype="image/jpeg",
+                                   max_age=JOB_CACHE_EXPIRE)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
+
 # === App Initialization ===
+init_payload_encoding(server)
 app = dash.Dash(__name__, server=server, external_stylesheets=[dbc.themes.SANDSTONE],
                 assets_folder=FILE_PREFIX + "assets", suppress_callback_exceptions=True,
-                url_base_pathname=URL_BASE_PATHNAME)
+                url_base_pathname=URL_BASE_PATHNAME, background_callback_manager=background_callback_manager)
 
 # === App Layout ===
 app.layout = html.Div([
@@ -88,8 +201,10 @@ app.layout = html.Div([
     dcc.Store(id="theme-store", storage_type="local"),
     dcc.Store(id="theme-clicks", data=0),
     dcc.Store(id="res-mode-store", data="native", storage_type="session"),
+    dcc.Store(id="field-store", data=DEFAULT_FIELD, storage_type="session"),
     dcc.Store(id="filtered-data-store", data=[], storage_type="session"),
     dcc.Store(id="sorted-table-data", data=[], storage_type="session"),
+    dcc.Store(id="tab-id", storage_type="session"),
     html.Div(id="cutout-placeholder", children=[]),
     html.Div(id="theme-wrapper", className="", children=[
         html.Div(id="page-content")])
@@ -101,15 +216,18 @@ register_callbacks(app, notes)
 @app.callback(
     Output("page-content", "children"),
     Input("url", "pathname"),
-    State("theme-store", "data")
+    Input("field-store", "data"),
+    State("theme-store", "data"),
+    State("res-mode-store", "data")
 )
-def display_page(pathname, stored_theme):
+def display_page(pathname, field, stored_theme, res_mode):
     theme = stored_theme or "dark"
+    field = field if field in FIELDS else DEFAULT_FIELD
     if pathname in [f"{url_basepath}/", f"{url_basepath}/home"]:
-        return home_layout(theme)
+        return home_layout(theme, field)
     elif pathname.startswith(f"{url_basepath}/viewer/"):
         source_name = unquote(pathname.split(f"{url_basepath}/viewer/")[1])
-        return viewer_layout(source_name)
+        return viewer_layout(source_name, res_mode or "native", field, theme)
     elif pathname == f"{url_basepath}/logout":
         return login()
     return html.Div("404 Page Not Found")
@@ -9,8 +9,13 @@ from astropy.visualization import simple_norm
 from astropy.coordinates import SkyCoord
 import astropy.units as u
 import pandas as pd
+import numpy as np
 import io
+import os
 import base64
+from functools import lru_cache
+
+from config import FIELDS
 
 def pil_image_to_base64(img):
     buf = io.BytesIO()
@@ -18,17 +23,40 @@ def pil_image_to_base64(img):
     encoded = base64.b64encode(buf.getvalue()).decode('utf-8')
     return "data:image/png;base64," + encoded
 
+def get_map_geometry(fits_path, png_path_local):
+    """
+    WCS and pixel sizes of the background map. Only the FITS header is read (memory-mapped), and the
+    result is cached until either file changes, so building a figure does not load the map pixels.
+    """
+    return _map_geometry(fits_path, png_path_local, os.path.getmtime(fits_path), os.path.getmtime(png_path_local))
+
+@lru_cache(maxsize=16)
+def _map_geometry(fits_path, png_path_local, fits_mtime, png_mtime):
+    with fits.open(fits_path, memmap=True) as hdul:
+        header = hdul[1].header
+    with Image.open(png_path_local) as img:
+        png_width, png_height = img.size
+    return WCS(header), header["NAXIS2"], header["NAXIS1"], png_width, png_height
+
+def create_field_map_figure(catalog_df, field, color_by='z'):
+    """
+    Map figure of catalog_df over the background map of the given field.
+    """
+    field_config = FIELDS[field]
+    return create_map_figure(
+        catalog_df=catalog_df,
+        fits_path=field_config["map_fits"],
+        png_path=field_config["map_url"],
+        png_path_local=field_config["map_png"],
+        color_by=color_by
+    )
+
 def create_map_figure(catalog_path=None,
                       catalog_df=None,
                       fits_path=None,
                       png_path=None,
                       png_path_local=None,
                       color_by='z'):
-    # Load image and calculate size
-    img = Image.open(png_path_local)
-    png_width, png_height = img.size
-
-
     # Load catalog if not passed
     if catalog_df is None:
         if catalog_path is None:
@@ -36,10 +64,8 @@ def create_map_figure(catalog_path=None,
         catalog_df = pd.read_csv(catalog_path)
 
     ra, dec = catalog_df["spt3g_ra(deg)"].values, catalog_df["spt3g_dec(deg)"].values
-    data = fits.open(fits_path)[1].data
-    wcs = WCS(fits.open(fits_path)[1].header)
+    wcs, fits_height, fits_width, png_width, png_height = get_map_geometry(fits_path, png_path_local)
     x, y = wcs.world_to_pixel(SkyCoord(ra*u.deg, dec*u.deg))
-    fits_height, fits_width = data.shape
     y *= (png_width / fits_width)
     x *= (png_height / fits_height)
 
@@ -80,12 +106,13 @@ def create_map_figure(catalog_path=None,
 
     # Add catalog points
     fig.add_trace(go.Scattergl(
-        x=x,
-        y=y_plot,
+        # float32 halves the typed arrays sent to the browser; plenty for pixel positions
+        x=x.astype(np.float32),
+        y=y_plot.astype(np.float32),
         mode="markers",
         marker=dict(
             size=15,
-            color=catalog_df[color_by],  # Optional: color by redshift or other column
+            color=catalog_df[color_by].to_numpy(dtype=np.float32),  # Optional: color by redshift or other column
             colorscale="Inferno",
             colorbar=dict(
                 len=0.5,  # height as a fraction of plot (e.g., 50%)
@@ -94,9 +121,9 @@ def create_map_figure(catalog_path=None,
             ),
             showscale=True
         ),
-        text=catalog_df["source_name"],
+        text=catalog_df["source_name"].to_numpy(),
         hoverinfo="text",
-        customdata=catalog_df["source_name"]  # send this to clickData
+        customdata=catalog_df.index.to_numpy(dtype=np.int32)  # catalog row ID, sent to clickData
     ))
 
     return fig
@@ -0,0 +1,45 @@
+import os
+import time
+
+import diskcache
+from dash import DiskcacheManager
+
+from config import JOB_CACHE_DIR, JOB_RESULTS_DIR, JOB_CACHE_EXPIRE
+from data_loader import data_version
+
+os.makedirs(JOB_RESULTS_DIR, exist_ok=True)
+
+# Background callbacks run in worker processes spawned by the manager; their status, progress and
+# results live in a local diskcache so any web worker can answer the polling requests.
+# Results are cached per (callback arguments, data version) for JOB_CACHE_EXPIRE seconds.
+job_cache = diskcache.Cache(JOB_CACHE_DIR)
+background_callback_manager = DiskcacheManager(job_cache, cache_by=[data_version], expire=JOB_CACHE_EXPIRE)
+
+
+def job_result_path(name):
+    return os.path.join(JOB_RESULTS_DIR, name)
+
+
+# Result files are kept this much longer than the job cache entries that link to them
+JOB_RESULT_GRACE = 3600
+
+
+def keep_job_results(names):
+    """
+    Mark result files as fresh when a job returns links to them, whether it wrote or reused them, so each file
+    outlives the job cache entry that holds its link (see prune_job_results).
+    """
+    now = time.time()
+    for name in names:
+        os.utime(job_result_path(name), (now, now))
+
+
+def prune_job_results():
+    """
+    Delete result files that no job cache entry can link to any more: those not marked by keep_job_results
+    for longer than the cache expiry plus JOB_RESULT_GRACE.
+    """
+    cutoff = time.time() - JOB_CACHE_EXPIRE - JOB_RESULT_GRACE
+    for entry in os.scandir(JOB_RESULTS_DIR):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
@@ -1,43 +1,48 @@
-import os
-import json
 from dash import html, dcc, dash_table
 import dash_bootstrap_components as dbc
 
-from html_utils import cutout_row, theme_toggle_button
-from data_loader import prepare_table_data, get_table_styles
-from interactive_map import create_map_figure
-from config import FILE_PREFIX, MAP_FITS, MAP_PNG, TABLE_COLUMNS, COLOR_OPTIONS, NOTES_FILE
+from notes import NotesStore
+from html_utils import cutout_row, theme_toggle_button, range_filter, similar_sources_row
+from histograms import get_slider_bins, empty_filter_columns
+from data_loader import (
+    prepare_table_data, round_table_data, get_table_styles, load_combined_catalog, row_for_source, snapshot_version
+)
+from sed import sed_figure, missing_mbb_settings
+from similarity import similar_sources
+from interactive_map import create_field_map_figure
+from contours import load_contours, level_key
+from config import (
+    TABLE_COLUMNS, COLOR_OPTIONS, NOTES_FILE, FIELDS, FIELD_OPTIONS, DEFAULT_FIELD, SIMILAR_SOURCES_COUNT,
+    CONTACT_SHEET_BANDS, CUTOUT_SUFFIX, VECTOR_CONTOURS, CONTOUR_LEVELS_SIGMA, CONTOUR_DEFAULT_LEVELS, INTERACTIVE_SED
+)
 
 # === Notes ===
-notes = json.load(open(NOTES_FILE)) if os.path.exists(NOTES_FILE) else {}
+notes = NotesStore(NOTES_FILE)
 
-header_text = 'This table contains a list of all SPT3G SMGs in the 100 sq. deg. SSDF field. Click on a ' \
+header_text = 'This table contains a list of all SPT3G SMGs in the {field} field. Click on a ' \
               'row in the table to view SPT3G, SPIRE and MeerKAT thumbnails and MBB fits for that source. ' \
               'Alternatively, you can click on the source in the SPIRE map on the right. The table can be ' \
               'filtered using the sliders below, or you can search for a source by name.'
 
 
 # === Home Page Layout ===
-def home_layout(theme="dark"):
+def home_layout(theme="dark", field=DEFAULT_FIELD):
     # prepare the dataframe used in the table
-    table_df = prepare_table_data(notes)
+    table_df = prepare_table_data(notes, field)
     # prepare the map figure used on the right-hand side of the page
-    map_fig = create_map_figure(
-        catalog_path=FILE_PREFIX + "assets/all_spt3g_sources_in_spire_field_20250519_no_NaNs_combined.csv",
-        catalog_df=None,
-        fits_path=MAP_FITS,
-        png_path="/assets/spt2_itermap_20120621_PLW.jpg",
-        png_path_local=MAP_PNG
-    )
+    map_fig = create_field_map_figure(table_df, field)
 
     initial_table_styles = get_table_styles(theme)
+    slider_bins = get_slider_bins(field)
+    # Leave out the derived columns the field has no values for (e.g. T_dust and L_IR without MBB fits)
+    empty_columns = empty_filter_columns(field)
 
     # return the HTML layout
     return html.Div([
         # Headers
         html.H1("SPT3G Source Catalog", style={"textAlign": "center", "marginTop": "20px", "marginBottom": "20px"}),
         html.H3(
-            header_text,
+            header_text.format(field=FIELDS[field]["label"]),
             style={
                 "textAlign": "center",
                 "marginTop": "20px",
@@ -49,8 +54,18 @@ def home_layout(theme="dark"):
             }
         ),
 
-        # Search bar
+        # Field selector and search bar
         html.Div([
+            html.Div([
+                html.Label("Field:"),
+                dcc.Dropdown(
+                    id="field-dropdown",
+                    options=FIELD_OPTIONS,
+                    value=field,
+                    clearable=False,
+                    style={"width": "250px", "margin": "20px"}
+                )
+            ], style={"marginRight": "20px"}),
             html.Div([
                 html.Label("Filter by Source Name:"),
                 dcc.Input(
@@ -61,6 +76,25 @@ def home_layout(theme="dark"):
                     style={"width": "90%", "padding": "15px", "margin": "20px"}
                 )
             ], style={"flex": "1", "marginRight": "2px"}),
+            html.Div([
+                html.Label("Search Notes:"),
+                dcc.Input(
+                    id="notes-search",
+                    type="text",
+                    placeholder="e.g., lensed",
+                    debounce=True,
+                    style={"width": "90%", "padding": "15px", "margin": "20px"}
+                )
+            ], style={"flex": "1", "marginRight": "2px"}),
+            html.Div([
+                html.Label("Sort by similarity to:"),
+                dcc.Dropdown(
+                    id="similar-to",
+                    options=table_df["source_name"].tolist(),
+                    placeholder="Pick a source...",
+                    style={"width": "300px", "margin": "20px"}
+                )
+            ], style={"marginRight": "20px"}),
 
             html.Div(
                 [dbc.Button("Logout", color="danger", href="/logout", external_link=True)],
@@ -72,95 +106,66 @@ def home_layout(theme="dark"):
         ], style={"display": "flex", "width": "95%", "margin": "20px"}),
 
         html.Div([
-            # Photometric redshift filter bar
-            html.Div([
-                html.Label("Filter by Photometric Redshift:"),
-                dcc.RangeSlider(
-                    id="redshift-slider",
-                    min=0.0,
-                    max=8.0,
-                    step=0.1,
-                    value=[0.0, 8.0],
-                    marks={i: str(i) for i in range(0, 9)},
-                    tooltip={"placement": "bottom", "always_visible": False},
-                    allowCross=False
-                )
-            ], style={"flex": "1", "marginRight": "20px"}),
-            html.Div([
-                html.Label("Filter by S(220GHz):"),
-                dcc.RangeSlider(
-                    id="s220-slider",
-                    min=1.0,
-                    max=26.0,
-                    step=0.05,
-                    value=[1.0, 26.0],
-                    marks={i: str(i) for i in range(0, 27) if i % 3 == 0},
-                    tooltip={"placement": "bottom", "always_visible": False},
-                    allowCross=False
-                )
-            ], style={"flex": "1", "marginRight": "20px"}),
-            html.Div([
-                html.Label("Filter by S(150GHz):"),
-                dcc.RangeSlider(
-                    id="s150-slider",
-                    min=0.0,
-                    max=6.0,
-                    step=0.05,
-                    value=[0.0, 6.0],
-                    marks={i: str(i) for i in range(0, 7)},
-                    tooltip={"placement": "bottom", "always_visible": False},
-                    allowCross=False
-                )
-            ], style={"flex": "1", "marginRight": "20px"}),
+            # Photometric redshift and flux filter bars
+            range_filter("redshift", "Filter by Photometric Redshift:", slider_bins["redshift"]),
+            range_filter("s220", "Filter by S(220GHz):", slider_bins["s220"]),
+            range_filter("s150", "Filter by S(150GHz):", slider_bins["s150"]),
 
             # spectral index filter bars
-            html.Div([
-                html.Label("Filter by alpha90:"),
-                dcc.RangeSlider(
-                    id="a90-slider",
-                    min=0.0,
-                    max=5.0,
-                    step=0.05,
-                    value=[0.0, 5.0],
-                    marks={i: str(i) for i in range(0, 9)},
-                    tooltip={"placement": "bottom", "always_visible": False},
-                    allowCross=False
-                )
-            ], style={"flex": "1", "marginRight": "20px"}),
-            html.Div([
-                html.Label("Filter by alpha220:"),
-                dcc.RangeSlider(
-                    id="a220-slider",
-                    min=0.0,
-                    max=5.0,
-                    step=0.05,
-                    value=[0.0, 5.0],
-                    marks={i: str(i) for i in range(0, 9)},
-                    tooltip={"placement": "bottom", "always_visible": False},
-                    allowCross=False
-                )
-            ], style={"flex": "1", "marginRight": "20px"}), ], style={"display": "flex", "width": "95%",
-                                                                      "margin": "20px"}),
+            range_filter("a90", "Filter by alpha90:", slider_bins["a90"]),
+            range_filter("a220", "Filter by alpha220:", slider_bins["a220"]),
 
-        html.Div(
-            id="result-count",
-            style={
-                "marginBottom": "10px",
-                "fontWeight": "bold",
-                "fontSize": "20px",
-                "color": "#00FFAA",
-                "fontFamily": "Montserrat, sans-serif",
-                "transition": "all 0.3s ease"
-            }
-        ),
+            # MBB fit derived quantities
+            range_filter("tdust", "Filter by T_dust (K):", slider_bins["tdust"]),
+            range_filter("lir", "Filter by log L_IR:", slider_bins["lir"]),
+        ], style={"display": "flex", "width": "95%", "margin": "20px"}),
+
+        html.Div([
+            html.Div(
+                id="result-count",
+                style={
+                    "marginBottom": "10px",
+                    "fontWeight": "bold",
+                    "fontSize": "20px",
+                    "color": "#00FFAA",
+                    "fontFamily": "Montserrat, sans-serif",
+                    "transition": "all 0.3s ease"
+                }
+            ),
+            dbc.Button("Export selection", id="export-button", color="info", n_clicks=0,
+                       style={"marginLeft": "20px", "marginBottom": "10px"}),
+            dbc.Progress(id="export-progress", value=0, max=1, striped=True, animated=True,
+                         style={"display": "none"}),
+            html.Div(id="export-status", style={"marginLeft": "20px", "marginBottom": "10px"}),
+            dbc.Button("Download export", id="export-download", color="success", external_link=True,
+                       style={"display": "none"}),
+        ], style={"display": "flex", "alignItems": "center"}),
+
+        # Contact sheet of the current selection in one band
+        html.Div([
+            html.Label("Contact sheet band:"),
+            dcc.Dropdown(
+                id="contact-sheet-band",
+                options=contact_sheet_band_options(),
+                value=CONTACT_SHEET_BANDS[0],
+                clearable=False,
+                style={"width": "200px", "marginLeft": "10px"}
+            ),
+            dbc.Button("Contact sheet", id="contact-sheet-button", color="info", n_clicks=0,
+                       style={"marginLeft": "20px"}),
+            dbc.Progress(id="contact-sheet-progress", value=0, max=1, striped=True, animated=True,
+                         style={"display": "none"}),
+            html.Div(id="contact-sheet-status", style={"marginLeft": "20px"}),
+        ], style={"display": "flex", "alignItems": "center", "marginBottom": "10px"}),
+        html.Div(id="contact-sheet", style={"margin": "0 5% 20px 5%", "overflowX": "auto"}),
 
         html.Div([
             # Left column: Data table
             html.Div(
                 dash_table.DataTable(
                     id='catalog-table',
-                    columns=TABLE_COLUMNS,
-                    data=table_df.to_dict("records"),
+                    columns=[column for column in TABLE_COLUMNS if column["id"] not in empty_columns],
+                    data=round_table_data(table_df).to_dict("records"),
                     style_table={"overflowY": "scroll", "maxHeight": "80vh"},
                     style_cell=initial_table_styles["style_cell"],
                     style_header=initial_table_styles["style_header"],
@@ -183,7 +188,7 @@ def home_layout(theme="dark"):
                     html.Label("Color points by:"),
                     dcc.Dropdown(
                         id="color-variable-dropdown",
-                        options=COLOR_OPTIONS,
+                        options=[option for option in COLOR_OPTIONS if option["value"] not in empty_columns],
                         value="z",  # default
                         clearable=False,
                         style={"width": "80%"}
@@ -199,7 +204,9 @@ def home_layout(theme="dark"):
                         style={"height": "50vh", "png_width": "100%"},
                         clear_on_unhover=True
                     )
-                )
+                ),
+                # Catalog snapshot the map's row IDs refer to
+                dcc.Store(id="map-version", data=snapshot_version(field))
             ],
                 style={"width": "30%", "position": "sticky", "top": "20px"}
             )
@@ -208,8 +215,119 @@ def home_layout(theme="dark"):
 
 
 # === Viewer Layout ===
-def viewer_layout(source_name):
+# Cutout panels of the viewer page (see html_utils.cutout_row); the SED panel (see sed_fit_panel) follows the
+# top row
+TOP_ROW_PANELS = [
+    {"prefix": "mk", "mode": "native", "suffix": CUTOUT_SUFFIX, "title": "MeerKAT", "folder": "mk",
+     "contours": True},
+    {"prefix": "spt3g220", "mode": "native", "suffix": CUTOUT_SUFFIX, "title": "SPT3G 220GHz", "folder": "spt3g220",
+     "contours": True},
+    {"prefix": "spt3g150", "mode": "native", "suffix": CUTOUT_SUFFIX, "title": "SPT3G 150GHz", "folder": "spt3g150",
+     "contours": True},
+    {"prefix": "spt3g90", "mode": "native", "suffix": CUTOUT_SUFFIX, "title": "SPT3G 90GHz", "folder": "spt3g90",
+     "contours": True},
+]
+SPIRE_ROW_PANELS = [
+    {"prefix": "spire500", "mode": "native", "suffix": CUTOUT_SUFFIX, "title": "SPIRE 500μm", "folder": "spire500",
+     "lazy": True, "contours": True},
+    {"prefix": "spire350", "mode": "native", "suffix": CUTOUT_SUFFIX, "title": "SPIRE 350μm", "folder": "spire350",
+     "lazy": True, "contours": True},
+    {"prefix": "spire250", "mode": "native", "suffix": CUTOUT_SUFFIX, "title": "SPIRE 250μm", "folder": "spire250",
+     "lazy": True, "contours": True},
+    {"prefix": "corner", "mode": ".", "folder": "corner_plots", "suffix": "corner", "title": "Corner Plot",
+     "lazy": True},
+]
+SED_PANEL = {"prefix": "sed", "mode": ".", "folder": "best_fit_plots", "suffix": "best-fit", "title": "SED Fit"}
+
+
+def contact_sheet_band_options():
+    titles = {panel["prefix"]: panel["title"] for panel in TOP_ROW_PANELS + SPIRE_ROW_PANELS}
+    return [{"label": titles.get(band, band), "value": band} for band in CONTACT_SHEET_BANDS]
+
+
+def similar_panel(source_name, mode="native", field=DEFAULT_FIELD):
+    """
+    Thumbnails of the nearest neighbours of the source in catalog feature space.
+    """
+    row_id = row_for_source(source_name, field)
+    if row_id is None:
+        return html.Div()
+    catalog = load_combined_catalog(field)
+    row_ids, distances = similar_sources(row_id, SIMILAR_SOURCES_COUNT, field)
+    names = catalog["source_name"].to_numpy()[row_ids]
+    redshifts = catalog["z"].to_numpy()[row_ids]
+    return html.Div([
+        html.H4("Similar sources", style={"marginBottom": "15px"}),
+        similar_sources_row(
+            [(name, f"z = {z:.2f}, distance {distance:.2f}") for name, z, distance in zip(names, redshifts, distances)],
+            mode=mode, asset_root=FIELDS[field]["asset_root"]
+        )
+    ])
+
+
+def sed_panel(source_name, field=DEFAULT_FIELD, theme="dark", compare=True):
+    """
+    Interactive MBB SED of the source, with (if compare) a dropdown to overplot other sources of the field. Its
+    options are filled in from the text typed into it (see callbacks.sed_compare_options). Without the MBB fit
+    columns this is a note naming the settings to fix.
+    """
+    catalog = load_combined_catalog(field)
+    missing = missing_mbb_settings(catalog.columns)
+    if missing:
+        return html.Div(f"No MBB fit columns: set {', '.join(missing)} to the column names of the MBB fit CSV.",
+                        style={"height": "300px", "display": "flex", "alignItems": "center",
+                               "justifyContent": "center", "padding": "0 10%"})
+
+    rows = catalog[catalog["source_name"] == source_name]
+    return html.Div([
+        dcc.Graph(
+            id="sed-graph",
+            figure=sed_figure(rows, theme),
+            config={"displayModeBar": False},
+            style={"height": "300px"}
+        ),
+        dcc.Dropdown(
+            id="sed-compare",
+            options=[],
+            multi=True,
+            placeholder="Type to find sources to overplot...",
+        ) if compare else None
+    ])
+
+
+def sed_fit_panel(source_name, field=DEFAULT_FIELD, theme="dark", compare=True):
+    """
+    The SED panel of the viewer's top row: the best_fit_plots PNG, or with INTERACTIVE_SED the sed_panel.
+    """
+    if not INTERACTIVE_SED:
+        return SED_PANEL
+    return {"title": "SED Fit", "content": sed_panel(source_name, field, theme, compare)}
+
+
+def contour_controls(source_name, field=DEFAULT_FIELD):
+    """
+    Contour on/off switch and level picker, with the source's traced contours for the clientside overlay.
+    """
+    return html.Div([
+        dbc.Switch(id="contour-toggle", value=True, label="Contours", style={"marginRight": "20px"}),
+        dcc.Checklist(
+            id="contour-levels",
+            options=[{"label": f" {level_key(level)}σ", "value": level} for level in CONTOUR_LEVELS_SIGMA],
+            value=[level for level in CONTOUR_DEFAULT_LEVELS if level in CONTOUR_LEVELS_SIGMA],
+            inline=True,
+            labelStyle={"marginRight": "15px"}
+        ),
+        dcc.Store(id="contour-data", data=load_contours(source_name, FIELDS[field]["asset_root"]))
+    ], style={"display": "flex", "justifyContent": "center", "alignItems": "center", "marginBottom": "20px"})
+
+
+def viewer_layout(source_name, mode="native", field=DEFAULT_FIELD, theme="dark"):
     note = notes.get(source_name, "")
+    if VECTOR_CONTOURS:
+        contour_text = "SPT3G 220GHz contours drawn over the images, reprojected where a band's cutout covers " \
+                       "a different footprint; pick the levels (in units of the 220GHz noise) above the cutouts."
+    else:
+        contour_text = "Radio contours from SPT3G 220GHz overlaid on all images."
 
     return dbc.Container([
         html.H1(f"{source_name} cutouts", style={"textAlign": "center", "marginBottom": "30px"}),
@@ -222,7 +340,7 @@ def viewer_layout(source_name):
                     {"label": "Native", "value": "native"},
                     {"label": "SPT-Convolved", "value": "convolved"},
                 ],
-                value="convolved",
+                value=mode,
                 inline=True,
                 style={"fontSize": "18px"},
                 labelStyle={
@@ -238,15 +356,12 @@ def viewer_layout(source_name):
             style={"textAlign": "center", "marginBottom": "20px"}
         ),
 
-        cutout_row([
-            {"prefix": "mk", "mode": "native", "suffix": "overlay", "title": "MeerKAT", "folder": "mk"},
-            {"prefix": "spt3g220", "mode": "native", "suffix": "overlay", "title": "SPT3G 220GHz", "folder":
-                "spt3g220"},
-            {"prefix": "spt3g150", "mode": "native", "suffix": "overlay", "title": "SPT3G 150GHz", "folder":
-                "spt3g150"},
-            {"prefix": "spt3g90", "mode": "native", "suffix": "overlay", "title": "SPT3G 90GHz", "folder": "spt3g90"},
-            {"prefix": "sed", "mode": ".", "folder": "best_fit_plots", "suffix": "best-fit", "title": "SED Fit"}
-        ], source_name),
+        contour_controls(source_name, field) if VECTOR_CONTOURS else None,
+
+        cutout_row(
+            TOP_ROW_PANELS + [sed_fit_panel(source_name, field, theme)],
+            source_name, mode=mode, asset_root=FIELDS[field]["asset_root"]
+        ),
 
         html.Div([
             # Info box on the left
@@ -254,7 +369,7 @@ def viewer_layout(source_name):
                 html.H4("Cutout Information", style={"marginBottom": "15px"}),
                 html.P([
                     html.Strong("Contours: "),
-                    "Radio contours from SPT3G 220GHz overlaid on all images."
+                    contour_text
                 ], style={"marginBottom": "10px"}),
                 html.P([
                     html.Strong("Resolution: "),
@@ -277,20 +392,13 @@ def viewer_layout(source_name):
 
             # Cutouts on the right
             html.Div(
-                cutout_row([
-                    {"prefix": "spire500", "mode": "native", "suffix": "overlay", "title": "SPIRE 500μm",
-                     "folder": "spire500"},
-                    {"prefix": "spire350", "mode": "native", "suffix": "overlay", "title": "SPIRE 350μm",
-                     "folder": "spire350"},
-                    {"prefix": "spire250", "mode": "native", "suffix": "overlay", "title": "SPIRE 250μm",
-                     "folder": "spire250"},
-                    {"prefix": "corner", "mode": ".", "folder": "corner_plots", "suffix": "corner",
-                     "title": "Corner Plot"}
-                ], source_name),
+                cutout_row(SPIRE_ROW_PANELS, source_name, mode=mode, asset_root=FIELDS[field]["asset_root"]),
                 style={"width": "100%"}
             )
         ], style={"display": "flex", "justifyContent": "flex-start", "marginBottom": "30px", "width": "100%"}),
 
+        similar_panel(source_name, mode, field),
+
         dcc.Textarea(
             id="notes-text",
             value=note,
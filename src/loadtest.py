@@ -0,0 +1,353 @@
+"""
+Replay review sessions against a running viewer and report latency per action.
+
+Each simulated reviewer logs in through /login and then loops over sessions: the home page, slider drags
+(update_table_and_map and the slider histograms), a table click into the viewer, the viewer's cutouts,
+Next/Prev through scroll_sources and a note save. Note saves write back the note already stored for the
+source and are skipped for sources without one, so a run leaves notes.json unchanged; against a scratch notes
+file, --note-text saves that text for sources without a note instead. Sessions are either synthetic (random, reproducible with
+--seed) or replayed from a JSON file holding a list of sessions, each a list of actions:
+
+    [[{"action": "home"},
+      {"action": "filter", "search": "SPT3G_23", "ranges": {"redshift": [1, 4]}},
+      {"action": "filter", "fractions": {"s220": [0.2, 0.8]}},
+      {"action": "open", "row": 3},
+      {"action": "assets"},
+      {"action": "next"}, {"action": "prev"},
+      {"action": "save_note"},
+      {"action": "think", "seconds": 2}]]
+
+--dump-sessions writes synthetic sessions in this format as a starting point.
+
+Usage:
+    python loadtest.py --url http://127.0.0.1:8000 --users 8 --duration 60
+    python loadtest.py --sessions sessions.json --users 4 --iterations 5
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from config import USERNAME, PASSWORD, SERVER_PORT, URL_BASE_PATHNAME, RANGE_FILTERS, DEFAULT_FIELD
+
+ASSET_URL = re.compile(r'"(?:src|data-src)": "(/assets/[^"]+)"')
+
+
+class Stats:
+    """
+    Thread-safe latency and error counts per action label.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.bytes = defaultdict(int)
+
+    def record(self, label, seconds, ok, n_bytes=0):
+        with self._lock:
+            self.latencies[label].append(seconds)
+            self.bytes[label] += n_bytes
+            if not ok:
+                self.errors[label] += 1
+
+    def report(self, elapsed):
+        """
+        Rows of (label, count, requests/s, p50, p95, p99 in ms, error rate, MB received), plus a total row.
+        """
+        rows = []
+        for label in sorted(self.latencies):
+            ms = np.array(self.latencies[label]) * 1000
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            rows.append((label, len(ms), len(ms) / elapsed, p50, p95, p99,
+                         self.errors[label] / len(ms), self.bytes[label] / 1e6))
+        all_ms = np.concatenate([np.array(v) for v in self.latencies.values()] or [np.zeros(1)]) * 1000
+        count = sum(len(v) for v in self.latencies.values())
+        p50, p95, p99 = np.percentile(all_ms, [50, 95, 99])
+        rows.append(("TOTAL", count, count / elapsed, p50, p95, p99,
+                     sum(self.errors.values()) / max(count, 1), sum(self.bytes.values()) / 1e6))
+        return rows
+
+
+def find_layout_props(node, found=None):
+    """
+    {component id: props} of every component with a string id in a Dash layout JSON tree.
+    """
+    if found is None:
+        found = {}
+    if isinstance(node, dict):
+        props = node.get("props")
+        if isinstance(props, dict) and isinstance(props.get("id"), str):
+            found[props["id"]] = props
+        for value in node.values():
+            find_layout_props(value, found)
+    elif isinstance(node, list):
+        for value in node:
+            find_layout_props(value, found)
+    return found
+
+
+class Reviewer:
+    """
+    One simulated browser tab: a logged-in requests session plus the client-side state (stores, table data,
+    current page) that the Dash renderer would send along with each callback.
+    """
+
+    def __init__(self, base_url, stats, field=DEFAULT_FIELD, note_text=None, timeout=60):
+        self.base_url = base_url.rstrip("/")
+        self.dash_prefix = self.base_url + URL_BASE_PATHNAME.rstrip("/")
+        self.stats = stats
+        self.note_text = note_text
+        self.timeout = timeout
+        self.http = requests.Session()
+        self.dependencies = []
+        self.values = {"field-store.data": field, "theme-store.data": "dark", "res-mode-store.data": "native"}
+        self.slider_bounds = {}
+        self.asset_urls = []
+
+    def timed(self, label, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.http.request(method, url, timeout=self.timeout, **kwargs)
+        except requests.RequestException:
+            self.stats.record(label, time.perf_counter() - start, False)
+            return None
+        ok = response.status_code < 400 or (response.status_code == 302 and label == "login")
+        self.stats.record(label, time.perf_counter() - start, ok, len(response.content))
+        return response if ok else None
+
+    def login(self, username, password):
+        response = self.timed("login", "POST", f"{self.base_url}/login",
+                              data={"username": username, "password": password}, allow_redirects=False)
+        if response is None or response.status_code != 302:
+            raise RuntimeError("login failed")
+        response = self.http.get(f"{self.dash_prefix}/_dash-dependencies", timeout=self.timeout)
+        response.raise_for_status()
+        self.dependencies = response.json()
+
+    def find_callback(self, output, trigger):
+        for dependency in self.dependencies:
+            inputs = [f"{i['id']}.{i['property']}" for i in dependency["inputs"]]
+            if output in dependency["output"] and trigger in inputs:
+                return dependency
+        raise KeyError(f"No callback for {output} triggered by {trigger}")
+
+    def callback(self, label, output, trigger, **changed):
+        """
+        Fire the callback with output that is triggered by trigger, as the renderer would: the changed
+        values are merged into the tab state, and every input and state is sent with its current value.
+
+        Returns:
+        - {component id: {property: value}} of the response, or None on errors and PreventUpdate
+        """
+        self.values.update(changed)
+        dependency = self.find_callback(output, trigger)
+        spec = dependency["output"]
+        outputs = [o.split(".", 1) for o in (spec[2:-2].split("...") if spec.startswith("..") else [spec])]
+        outputs = [{"id": o[0], "property": o[1].split("@")[0]} for o in outputs]
+        payload = {
+            "output": spec,
+            "outputs": outputs if spec.startswith("..") else outputs[0],
+            "inputs": [{**i, "value": self.values.get(f"{i['id']}.{i['property']}")} for i in dependency["inputs"]],
+            "state": [{**s, "value": self.values.get(f"{s['id']}.{s['property']}")} for s in dependency["state"]],
+            "changedPropIds": [trigger],
+        }
+        response = self.timed(label, "POST", f"{self.dash_prefix}/_dash-update-component", json=payload)
+        if response is None or response.status_code == 204:
+            return None
+        result = response.json()["response"]
+        for component_id, props in result.items():
+            for prop, value in props.items():
+                self.values[f"{component_id}.{prop}"] = value
+        return result
+
+    def show_page(self, label, pathname):
+        result = self.callback(label, "page-content.children", "url.pathname", **{"url.pathname": pathname})
+        if result is None:
+            return {}
+        layout = result["page-content"]["children"]
+        props = find_layout_props(layout)
+        for component_id, component_props in props.items():
+            if "value" in component_props:
+                self.values[f"{component_id}.value"] = component_props["value"]
+            if "data" in component_props:
+                self.values[f"{component_id}.data"] = component_props["data"]
+        self.asset_urls = ASSET_URL.findall(json.dumps(layout))
+        return props
+
+    # --- actions ---
+
+    def home(self):
+        self.timed("GET /", "GET", f"{self.base_url}/")
+        props = self.show_page("home page", "/")
+        self.slider_bounds = {key: [props[f"{key}-slider"]["min"], props[f"{key}-slider"]["max"]]
+                              for key in RANGE_FILTERS if f"{key}-slider" in props}
+        self.filter(None, {})
+
+    def filter(self, search=None, ranges=None, fractions=None):
+        """
+        Set the search text and slider ranges; sliders missing from ranges are reset to their full range.
+        fractions gives ranges as fractions of the slider bounds instead.
+        """
+        ranges = dict(ranges or {})
+        for key, (low, high) in (fractions or {}).items():
+            lo, hi = self.slider_bounds[key]
+            ranges[key] = [round(lo + low * (hi - lo), 3), round(lo + high * (hi - lo), 3)]
+        changed = {"search-input.value": search}
+        for key, bounds in self.slider_bounds.items():
+            changed[f"{key}-slider.value"] = ranges.get(key, bounds)
+        trigger = next((f"{key}-slider.value" for key in ranges), "search-input.value")
+        self.callback("filter table+map", "catalog-table.data", trigger, **changed)
+        self.callback("filter histograms", "-hist.figure", trigger)
+
+    def open(self, row=0):
+        records = self.values.get("catalog-table.data") or []
+        if not records:
+            return
+        cell = {"row": row % len(records), "column": 0, "column_id": "source_name"}
+        result = self.callback("open viewer", "url.pathname", "catalog-table.active_cell",
+                               **{"catalog-table.active_cell": cell})
+        if result:
+            self.show_page("viewer page", result["url"]["pathname"])
+
+    def assets(self):
+        for url in self.asset_urls:
+            self.timed("asset", "GET", self.base_url + url)
+
+    def navigate(self, button):
+        clicks = (self.values.get(f"{button}.n_clicks") or 0) + 1
+        self.callback(f"{button.split('-')[0]} (store click)", "last-nav-click.data", f"{button}.n_clicks",
+                      **{f"{button}.n_clicks": clicks})
+        result = self.callback(f"{button.split('-')[0]} (scroll)", "url.pathname", "last-nav-click.data")
+        if result:
+            self.show_page("viewer page", result["url"]["pathname"])
+            self.assets()
+
+    def save_note(self):
+        # Saves the note already stored for the source, so the notes file content does not change
+        if not self.values.get("notes-text.value"):
+            if not self.note_text:
+                return
+            self.values["notes-text.value"] = self.note_text
+        clicks = (self.values.get("save-button.n_clicks") or 0) + 1
+        self.callback("save note", "save-status.children", "save-button.n_clicks",
+                      **{"save-button.n_clicks": clicks})
+
+    def run(self, actions):
+        for action in actions:
+            kind = action["action"]
+            if kind == "home":
+                self.home()
+            elif kind == "filter":
+                self.filter(action.get("search"), action.get("ranges"), action.get("fractions"))
+            elif kind == "open":
+                self.open(action.get("row", 0))
+            elif kind == "assets":
+                self.assets()
+            elif kind in ("next", "prev"):
+                self.navigate(f"{kind}-button")
+            elif kind == "save_note":
+                self.save_note()
+            elif kind == "think":
+                time.sleep(action["seconds"])
+            else:
+                raise ValueError(f"Unknown action {kind!r}")
+
+
+def synthetic_session(rng, think=1.0, n_drags=4, n_scrolls=5, row_range=50):
+    """
+    A random review session. Slider ranges are given as fractions of the slider bounds.
+    """
+    actions = [{"action": "home"}]
+    for _ in range(n_drags):
+        key = rng.choice(list(RANGE_FILTERS))
+        low, high = sorted(rng.uniform(0, 1) for _ in range(2))
+        actions.append({"action": "filter", "fractions": {key: [low, high]}})
+        actions.append({"action": "think", "seconds": rng.expovariate(1 / think) if think else 0})
+    actions.append({"action": "filter"})
+    actions.append({"action": "open", "row": rng.randrange(row_range)})
+    actions.append({"action": "assets"})
+    for _ in range(n_scrolls):
+        actions.append({"action": "think", "seconds": rng.expovariate(1 / think) if think else 0})
+        actions.append({"action": rng.choice(["next", "next", "prev"])})
+    actions.append({"action": "save_note"})
+    return actions
+
+
+def run_user(user, args, stats, sessions, deadline):
+    rng = random.Random(args.seed + user)
+    reviewer = Reviewer(args.url, stats, field=args.field, note_text=args.note_text)
+    reviewer.login(args.username, args.password)
+    iteration = 0
+    while time.time() < deadline and (args.iterations is None or iteration < args.iterations):
+        if sessions:
+            actions = sessions[(user + iteration) % len(sessions)]
+        else:
+            actions = synthetic_session(rng, args.think)
+        reviewer.run(actions)
+        iteration += 1
+    return iteration
+
+
+def print_report(rows, elapsed, sessions_done):
+    print(f"{sessions_done} sessions in {elapsed:.1f} s")
+    print(f"{'action':<26}{'count':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}{'MB':>9}")
+    for label, count, rate, p50, p95, p99, error_rate, megabytes in rows:
+        print(f"{label:<26}{count:>8}{rate:>9.2f}{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}{error_rate:>8.1%}{megabytes:>9.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=f"http://127.0.0.1:{SERVER_PORT}", help="base URL of the running app")
+    parser.add_argument("--username", default=USERNAME)
+    parser.add_argument("--password", default=PASSWORD)
+    parser.add_argument("--field", default=DEFAULT_FIELD)
+    parser.add_argument("--users", type=int, default=4, help="concurrent reviewers")
+    parser.add_argument("--duration", type=float, default=60, help="stop starting new sessions after this many seconds")
+    parser.add_argument("--iterations", type=int, help="sessions per reviewer (default: until --duration)")
+    parser.add_argument("--think", type=float, default=1.0, help="mean think time between actions in seconds")
+    parser.add_argument("--sessions", help="JSON file of sessions to replay instead of synthetic ones")
+    parser.add_argument("--dump-sessions", type=int, metavar="N", help="print N synthetic sessions as JSON and exit")
+    parser.add_argument("--note-text", help="note saved for sources without one (use with a scratch notes file)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    if args.dump_sessions:
+        rng = random.Random(args.seed)
+        json.dump([synthetic_session(rng, args.think) for _ in range(args.dump_sessions)], sys.stdout, indent=2)
+        return 0
+
+    sessions = None
+    if args.sessions:
+        with open(args.sessions) as f:
+            sessions = json.load(f)
+
+    stats = Stats()
+    start = time.time()
+    deadline = start + args.duration
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        futures = [pool.submit(run_user, user, args, stats, sessions, deadline) for user in range(args.users)]
+        sessions_done = sum(future.result() for future in futures)
+    elapsed = time.time() - start
+
+    rows = stats.report(elapsed)
+    print_report(rows, elapsed, sessions_done)
+    if args.json:
+        keys = ["action", "count", "rps", "p50_ms", "p95_ms", "p99_ms", "error_rate", "megabytes"]
+        with open(args.json, "w") as f:
+            json.dump({"elapsed": elapsed, "sessions": sessions_done, "users": args.users,
+                       "actions": [dict(zip(keys, row)) for row in rows]}, f, indent=2)
+    return 1 if any(stats.errors.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
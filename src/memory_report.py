@@ -0,0 +1,84 @@
+"""
+Report the memory held by the catalog and the per-request allocations of the table and map figure.
+
+Usage:
+    python memory_report.py [field]
+"""
+import json
+import sys
+import tracemalloc
+
+import pandas as pd
+import plotly.io as pio
+from plotly.utils import PlotlyJSONEncoder
+
+from config import FIELDS, DEFAULT_FIELD, NOTES_FILE
+from data_loader import (
+    join_avoiding_duplicates, load_combined_catalog, prepare_table_data, round_table_data, field_cache
+)
+from interactive_map import create_field_map_figure
+
+
+def mib(n_bytes):
+    return f"{n_bytes / 1024**2:8.2f} MiB"
+
+
+def traced(fn):
+    """
+    Call fn and return (result, peak bytes allocated during the call).
+    """
+    tracemalloc.start()
+    try:
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+def main(field=DEFAULT_FIELD):
+    field_config = FIELDS[field]
+    raw = join_avoiding_duplicates(pd.read_csv(field_config["catalog_csv"]), pd.read_csv(field_config["mbb_fit_csv"]),
+                                   "source_name")
+    catalog = load_combined_catalog(field)
+    raw_usage = raw.memory_usage(deep=True)
+    usage = catalog.memory_usage(deep=True)
+
+    print(f"Catalog of field {field}: {len(catalog)} rows x {len(catalog.columns)} columns")
+    print(f"{'column':<40}{'dtype':>12}{'raw':>14}{'compact':>14}")
+    for col in catalog.columns:
+        print(f"{col:<40}{str(catalog[col].dtype):>12}{mib(raw_usage[col]):>14}{mib(usage[col]):>14}")
+    print(f"{'total':<40}{'':>12}{mib(raw_usage.sum()):>14}{mib(usage.sum()):>14}")
+
+    notes = {}
+    try:
+        with open(NOTES_FILE) as f:
+            notes = json.load(f)
+    except FileNotFoundError:
+        pass
+
+    table_df, table_peak = traced(lambda: prepare_table_data(notes, field))
+    _, records_peak = traced(lambda: round_table_data(table_df).to_dict("records"))
+    build_figure = lambda: create_field_map_figure(table_df, field)
+    build_figure()  # warm the map geometry cache and plotly templates
+    fig, figure_peak = traced(build_figure)
+    trace = fig.to_plotly_json()["data"][0]
+
+    print()
+    print("Per request (all rows):")
+    print(f"  prepare_table_data allocation   {mib(table_peak)}")
+    print(f"  table records allocation        {mib(records_peak)}")
+    print(f"  map figure allocation           {mib(figure_peak)}")
+    print(f"  map figure JSON                 {mib(len(pio.to_json(fig)))}")
+    print(f"    customdata (row IDs)          {mib(len(json.dumps(trace['customdata'], cls=PlotlyJSONEncoder)))}")
+    print(f"    text (source names)           {mib(len(json.dumps(trace['text'], cls=PlotlyJSONEncoder)))}")
+
+    print()
+    print("Field cache (catalog and derived data, per worker):")
+    for name, n_bytes in field_cache.report().items():
+        print(f"  {name:<32}{mib(n_bytes)}")
+    print(f"  {'limit':<32}{mib(field_cache.max_bytes)}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_FIELD)
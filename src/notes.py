@@ -0,0 +1,159 @@
+import fcntl
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections.abc import Mapping
+
+
+class NotesIndex:
+    """
+    Full-text index of note contents in an in-memory SQLite FTS5 table, kept in step with a NotesStore.
+
+    Each source gets a fixed rowid, so updating or removing a note touches only that note's index entries.
+    """
+
+    def __init__(self):
+        self._db = sqlite3.connect(":memory:", check_same_thread=False)
+        self._db.execute(
+            "CREATE VIRTUAL TABLE notes USING fts5(body, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        self._lock = threading.Lock()
+        self._rowids = {}
+        self._names = []
+
+    def update(self, changes):
+        """
+        Apply {source_name: note text}; empty or None text removes the source from the index.
+        """
+        with self._lock, self._db:
+            for source_name, text in changes.items():
+                rowid = self._rowids.get(source_name)
+                if rowid is not None:
+                    self._db.execute("DELETE FROM notes WHERE rowid = ?", (rowid,))
+                if not text:
+                    continue
+                if rowid is None:
+                    rowid = self._rowids[source_name] = len(self._names)
+                    self._names.append(source_name)
+                self._db.execute("INSERT INTO notes(rowid, body) VALUES (?, ?)", (rowid, text))
+
+    def search(self, query):
+        """
+        Names of the sources whose notes contain every word of query, each also matching as a prefix
+        ("lens" finds "lensed"). Returns a set.
+        """
+        words = re.findall(r"\w+", query)
+        if not words:
+            return set()
+        match = " ".join(f'"{word}"*' for word in words)
+        with self._lock:
+            rows = self._db.execute("SELECT rowid FROM notes WHERE notes MATCH ?", (match,)).fetchall()
+        return {self._names[rowid] for rowid, in rows}
+
+
+class NotesStore(Mapping):
+    """
+    Reviewer notes backed by a JSON file shared by all workers.
+
+    Reads go to an in-memory dict that is replaced as a whole (never mutated), so readers always see a
+    complete version. refresh() picks up changes written by other workers; save() merges the note into the
+    latest file contents under an exclusive file lock. The file is rewritten in place rather than renamed
+    over, because it is usually a single-file bind mount. Both keep the full-text index (see search) up to date
+    with only the notes that changed.
+
+    A forked child (e.g. a background job) gets its own lock and index, rebuilt from the notes: the parent's
+    SQLite connection must not be used across fork(), and its locks may have been held by another thread.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = {}
+        self._version = None
+        self._index = NotesIndex()
+        self.refresh()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._index = NotesIndex()
+        self._index.update(self._data)
+
+    def __getitem__(self, source_name):
+        return self._data[source_name]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def _file_version(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    @staticmethod
+    def _read(f):
+        f.seek(0)
+        text = f.read()
+        return json.loads(text) if text.strip() else {}
+
+    def refresh(self):
+        """
+        Reload the notes if the file changed since it was last read or written. Returns True on reload.
+        """
+        version = self._file_version()
+        if version == self._version:
+            return False
+        with self._lock:
+            if version is None:
+                data = {}
+            else:
+                with open(self.path) as f:
+                    fcntl.flock(f, fcntl.LOCK_SH)
+                    try:
+                        data = self._read(f)
+                    except ValueError:
+                        # Partially written by another process; try again on the next refresh
+                        return False
+            self._index.update(_changed_notes(self._data, data))
+            self._data = data
+            self._version = version
+        return True
+
+    def save(self, source_name, note_text):
+        """
+        Store one note, keeping any notes other workers saved since our last read.
+        """
+        with self._lock:
+            with open(self.path, "a+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                data = self._read(f)
+                data[source_name] = note_text
+                f.seek(0)
+                f.truncate()
+                json.dump(data, f, indent=2)
+                f.flush()
+            self._index.update(_changed_notes(self._data, data))
+            self._data = data
+            self._version = self._file_version()
+
+    def search(self, query):
+        """
+        Source names whose note matches query (see NotesIndex.search).
+        """
+        return self._index.search(query)
+
+
+def _changed_notes(old, new):
+    """
+    {source_name: new text, or None if removed} for the notes that differ between two versions.
+    """
+    changes = {name: text for name, text in new.items() if old.get(name) != text}
+    changes.update((name, None) for name in old.keys() - new.keys())
+    return changes
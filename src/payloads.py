@@ -0,0 +1,76 @@
+"""
+Encoding of callback responses: orjson for the JSON structure, response compression negotiated with the
+client (Accept-Encoding) and optional per-stage byte counts.
+
+Numeric figure arrays are sent as numpy arrays, which Plotly serializes as base64 typed arrays
+({"dtype": "f4", "bdata": ...}) rather than lists of floats.
+"""
+import json
+import logging
+import time
+
+import plotly.io as pio
+from flask import g, request
+from flask_compress import Compress
+
+from config import COMPRESS_ALGORITHM, COMPRESS_BR_LEVEL, PAYLOAD_LOGGING
+
+logger = logging.getLogger(__name__)
+
+PAYLOAD_HEADER = "X-Uncompressed-Length"
+
+
+def init_payload_encoding(server):
+    """
+    Set up JSON encoding and compression on the Flask server; call before creating the Dash app.
+
+    Flask runs after_request hooks in reverse order of registration, so the byte count of the JSON body is
+    taken before flask-compress runs and the compressed size after it.
+    """
+    pio.json.config.default_engine = "orjson"
+    server.config["COMPRESS_ALGORITHM"] = COMPRESS_ALGORITHM
+    server.config["COMPRESS_BR_LEVEL"] = COMPRESS_BR_LEVEL
+
+    if PAYLOAD_LOGGING:
+        logger.setLevel(logging.INFO)
+        if not logging.getLogger().handlers:
+            logging.basicConfig()
+        server.before_request(_start_timer)
+        server.after_request(_log_payload)
+    Compress(server)
+    server.after_request(_count_payload)
+
+
+def _is_callback():
+    return request.path.endswith("/_dash-update-component")
+
+
+def _start_timer():
+    g.payload_start = time.perf_counter()
+
+
+def _count_payload(response):
+    """
+    Record the size of the JSON body, before compression, and with PAYLOAD_LOGGING its size per output component.
+    """
+    if _is_callback() and not response.is_streamed:
+        response.headers[PAYLOAD_HEADER] = str(response.content_length or 0)
+        if PAYLOAD_LOGGING and response.status_code == 200:
+            body = json.loads(response.get_data())
+            g.payload_stages = {component_id: len(json.dumps(props, separators=(",", ":")))
+                                for component_id, props in body.get("response", {}).items()}
+    return response
+
+
+def _log_payload(response):
+    """
+    Log the JSON size per output component, the total JSON and on-the-wire sizes and the request time.
+    """
+    if not _is_callback() or PAYLOAD_HEADER not in response.headers:
+        return response
+    output = (request.get_json(silent=True) or {}).get("output", "?")
+    stages = ", ".join(f"{component_id} {n_bytes} B" for component_id, n_bytes in g.get("payload_stages", {}).items())
+    elapsed = (time.perf_counter() - g.get("payload_start", time.perf_counter())) * 1000
+    logger.info("%s: %s B json (%s), %d B %s, %.0f ms", output, response.headers[PAYLOAD_HEADER], stages,
+                response.content_length or 0, response.headers.get("Content-Encoding", "identity"), elapsed)
+    return response
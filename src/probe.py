@@ -0,0 +1,211 @@
+"""
+Pixel-value probe of the FITS cutouts behind the PNGs: map values, a local noise estimate and sky
+coordinates at pixel or sky positions, for cursor readouts on the viewer page.
+
+Cutouts are memory-mapped and their WCS parsed once per file version, so a probe only touches the few pixels
+it reads.
+"""
+import math
+import os
+import threading
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from astropy.io import fits
+from astropy.wcs import WCS
+
+from config import (
+    CUTOUT_FITS_ROOT, FIELDS, DEFAULT_FIELD, ASSET_MODES, ASSET_FOLDERS, PROBE_NOISE_EXTENSION,
+    PROBE_NOISE_BOX, PROBE_MAX_POSITIONS, PROBE_CACHE_FILES
+)
+
+# Scale of the median absolute deviation to the standard deviation of Gaussian noise
+MAD_TO_SIGMA = 1.4826
+
+
+def cutout_fits_path(source_name, band, mode="native", asset_root=""):
+    return os.path.join(CUTOUT_FITS_ROOT, f"{asset_root}{mode}", band, f"{source_name}.fits")
+
+
+def open_cutout(path):
+    """
+    Memory-mapped cutout at path, cached until the file changes.
+
+    Returns:
+    - dict with "data" (2-D map), "noise" (2-D noise map from the PROBE_NOISE_EXTENSION HDU, or None),
+      "wcs" (celestial WCS, or None if the header has none), "lock" (held while using the WCS, which is
+      not thread-safe) and "unit" (BUNIT, or None)
+    Raises FileNotFoundError if there is no cutout.
+    """
+    return _open_cutout(path, os.path.getmtime(path))
+
+
+@lru_cache(maxsize=PROBE_CACHE_FILES)
+def _open_cutout(path, mtime):
+    # The HDU list stays open for as long as the cache holds its arrays
+    hdul = fits.open(path, memmap=True)
+    image = next(hdu for hdu in hdul if hdu.is_image and hdu.header.get("NAXIS", 0) >= 2)
+    noise = hdul[PROBE_NOISE_EXTENSION].data if PROBE_NOISE_EXTENSION in hdul else None
+    wcs = WCS(image.header)
+    wcs = wcs.celestial if wcs.has_celestial else None
+    if wcs is not None:
+        wcs.wcs.set()
+    return {
+        "data": _plane(image.data),
+        "noise": _plane(noise) if noise is not None else None,
+        "wcs": wcs,
+        "lock": threading.Lock(),
+        "unit": image.header.get("BUNIT"),
+    }
+
+
+def _plane(data):
+    # First plane of cubes, as in fits_to_png
+    while data.ndim > 2:
+        data = data[0]
+    return data
+
+
+def local_noise(data, xs, ys, box=PROBE_NOISE_BOX):
+    """
+    Robust standard deviation (scaled MAD) of the finite pixels in a box x box square centred on each pixel
+    (xs[k], ys[k]), NaN where fewer than 3 pixels are finite. All boxes are cut from one NaN-padded region
+    around the positions, so a neighbourhood grid costs a single vectorized median.
+    """
+    half = box // 2
+    x0, y0 = xs.min() - half, ys.min() - half
+    x1, y1 = xs.max() + half + 1, ys.max() + half + 1
+    ny, nx = data.shape
+    region = np.full((y1 - y0, x1 - x0), np.nan)
+    region[max(y0, 0) - y0:min(y1, ny) - y0, max(x0, 0) - x0:min(x1, nx) - x0] = \
+        data[max(y0, 0):min(y1, ny), max(x0, 0):min(x1, nx)]
+    patches = sliding_window_view(region, (box, box))[ys - ys.min(), xs - xs.min()].reshape(len(xs), -1)
+
+    finite = np.isfinite(patches)
+    if finite.all():
+        # np.median is several times faster than np.nanmedian; blank pixels only occur near edges
+        median = np.median(patches, axis=1, keepdims=True)
+        return MAD_TO_SIGMA * np.median(np.abs(patches - median), axis=1)
+
+    noise = np.full(len(xs), np.nan)
+    valid = finite.sum(axis=1) >= 3
+    if valid.any():
+        patches = patches[valid]
+        median = np.nanmedian(patches, axis=1, keepdims=True)
+        noise[valid] = MAD_TO_SIGMA * np.nanmedian(np.abs(patches - median), axis=1)
+    return noise
+
+
+def grid_positions(x, y, radius):
+    """
+    Pixel positions of the (2 radius + 1)^2 neighbourhood around (x, y), row by row.
+    """
+    offsets = np.arange(-radius, radius + 1)
+    dy, dx = np.meshgrid(offsets, offsets, indexing="ij")
+    return np.column_stack([x + dx.ravel(), y + dy.ravel()])
+
+
+def parse_probe_args(args):
+    """
+    Decode probe request arguments: a query string (x and y, or ra and dec, for one position) or a JSON body
+    (lists "pixels" of [x, y] or "sky" of [ra, dec]). Both take field, source, band, mode and radius.
+
+    Returns:
+    - field and the keyword arguments of probe()
+    """
+    field = args.get("field") or DEFAULT_FIELD
+    if field not in FIELDS:
+        raise ValueError(f"Unknown field {field!r}")
+    band = args.get("band")
+    if band not in ASSET_FOLDERS:
+        raise ValueError(f"Unknown band {band!r}")
+
+    radius = int(args.get("radius") or 0)
+    # Checked before probe() builds the (2 radius + 1)^2 grid
+    if radius < 0 or (2 * radius + 1)**2 > PROBE_MAX_POSITIONS:
+        raise ValueError(f"radius must be between 0 and {(math.isqrt(PROBE_MAX_POSITIONS) - 1) // 2}")
+
+    kwargs = {"source_name": args.get("source"), "band": band, "mode": args.get("mode") or "native",
+              "asset_root": FIELDS[field]["asset_root"], "radius": radius}
+    if args.get("pixels") is not None:
+        kwargs["pixels"] = args["pixels"]
+    elif args.get("sky") is not None:
+        kwargs["sky"] = args["sky"]
+    elif args.get("x") is not None and args.get("y") is not None:
+        kwargs["pixels"] = [[float(args["x"]), float(args["y"])]]
+    elif args.get("ra") is not None and args.get("dec") is not None:
+        kwargs["sky"] = [[float(args["ra"]), float(args["dec"])]]
+    return field, kwargs
+
+
+def probe(source_name, band, mode="native", asset_root="", pixels=None, sky=None, radius=0):
+    """
+    Map values at pixel or sky positions of a source's cutout.
+
+    Parameters:
+    - pixels: sequence of (x, y) 0-based FITS pixel positions (y up, as in the PNGs flipped vertically)
+    - sky: sequence of (RA, Dec) in degrees; used when pixels is None
+    - radius: with a single position, probe the (2 radius + 1)^2 pixel grid around it instead
+
+    Returns:
+    - dict with "unit" and "positions", a list of {"x", "y", "ra", "dec", "value", "noise", "snr"} at the
+      nearest pixel of each position; values outside the cutout are None
+    Raises ValueError for bad arguments, including non-finite positions and positions more than the cutout's
+    width or height outside it, and FileNotFoundError if the cutout does not exist.
+    """
+    if mode not in ASSET_MODES:
+        raise ValueError(f"Unknown mode {mode!r}")
+    cutout = open_cutout(cutout_fits_path(source_name, band, mode, asset_root))
+    wcs, data, noise_map = cutout["wcs"], cutout["data"], cutout["noise"]
+
+    if pixels is not None:
+        xy = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+    elif sky is not None:
+        if wcs is None:
+            raise ValueError("Cutout has no sky coordinates")
+        with cutout["lock"]:
+            xy = wcs.all_world2pix(np.asarray(sky, dtype=np.float64).reshape(-1, 2), 0)
+    else:
+        raise ValueError("No positions given")
+    ny, nx = data.shape
+    # Positions may lie outside the cutout (their values are None), but not further than its own size
+    if not np.isfinite(xy).all():
+        raise ValueError("Positions must be finite")
+    if ((xy[:, 0] < -nx) | (xy[:, 0] > 2 * nx) | (xy[:, 1] < -ny) | (xy[:, 1] > 2 * ny)).any():
+        raise ValueError("Positions too far outside the cutout")
+    if radius and len(xy) == 1:
+        if radius < 0 or (2 * radius + 1)**2 > PROBE_MAX_POSITIONS:
+            raise ValueError(f"At most {PROBE_MAX_POSITIONS} positions per request")
+        xy = grid_positions(*np.rint(xy[0]), radius)
+    if len(xy) > PROBE_MAX_POSITIONS:
+        raise ValueError(f"At most {PROBE_MAX_POSITIONS} positions per request")
+    if wcs is not None:
+        with cutout["lock"]:
+            world = wcs.all_pix2world(np.rint(xy), 0)
+    else:
+        world = np.full_like(xy, np.nan)
+
+    ix, iy = np.rint(xy[:, 0]).astype(np.int64), np.rint(xy[:, 1]).astype(np.int64)
+    inside = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+
+    noise = np.full(len(xy), np.nan)
+    if noise_map is not None:
+        noise[inside] = noise_map[iy[inside], ix[inside]]
+    elif inside.any():
+        noise[inside] = local_noise(data, ix[inside], iy[inside])
+
+    positions = []
+    for k in range(len(xy)):
+        entry = {"x": int(ix[k]), "y": int(iy[k]), "ra": None, "dec": None, "value": None, "noise": None,
+                 "snr": None}
+        if np.isfinite(world[k]).all():
+            entry["ra"], entry["dec"] = float(world[k, 0]), float(world[k, 1])
+        if inside[k]:
+            value = float(data[iy[k], ix[k]])
+            entry["value"] = value if np.isfinite(value) else None
+            entry["noise"] = float(noise[k]) if np.isfinite(noise[k]) else None
+            if entry["value"] is not None and entry["noise"]:
+                entry["snr"] = value / entry["noise"]
+        positions.append(entry)
+    return {"unit": cutout["unit"], "positions": positions}
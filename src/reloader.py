@@ -0,0 +1,41 @@
+import logging
+import os
+import threading
+import time
+
+from config import RELOAD_INTERVAL
+from data_loader import field_cache
+
+logger = logging.getLogger(__name__)
+
+_watcher_lock = threading.Lock()
+_watcher_pid = None
+
+
+def start_reload_watcher(notes, interval=RELOAD_INTERVAL):
+    """
+    Start the background thread that reloads changed notes and field catalogs, once per process.
+
+    Safe to call on every request: worker processes forked after the first call start their own watcher,
+    so every worker picks up new data on its own.
+    """
+    global _watcher_pid
+    if interval <= 0 or _watcher_pid == os.getpid():
+        return
+    with _watcher_lock:
+        if _watcher_pid == os.getpid():
+            return
+        _watcher_pid = os.getpid()
+        threading.Thread(target=_watch, args=(notes, interval), name="reload-watcher", daemon=True).start()
+
+
+def _watch(notes, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            if notes.refresh():
+                logger.info("Reloaded notes")
+            for field in field_cache.refresh():
+                logger.info("Reloaded catalog of field %s", field)
+        except Exception:
+            logger.exception("Reload failed; keeping the current data")
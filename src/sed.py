@@ -0,0 +1,162 @@
+"""
+Modified blackbody (MBB) SEDs evaluated from the catalog fit parameters.
+
+The observed flux density of a source at redshift z is
+
+    S(nu_obs) = 10**log_norm * MBB_NORM_MJY * (nu / nu_ref)**(3 + beta) * expm1(h nu_ref / k T) / expm1(h nu / k T)
+
+with nu = nu_obs * (1 + z) the rest-frame frequency and nu_ref the rest-frame frequency of MBB_REFERENCE_UM,
+i.e. an optically thin nu**beta B_nu(T) normalized at the reference wavelength. This parameterisation is not yet
+confirmed against the fit code, so the viewer only draws it with INTERACTIVE_SED and otherwise shows the
+best_fit_plots PNGs. All functions work on whole arrays of sources at once: per-source parameters are 1-d arrays
+and the frequency grid broadcasts against them.
+"""
+import numpy as np
+import plotly.graph_objects as go
+import plotly.express as px
+from astropy.cosmology import Planck18
+
+from config import MBB_COLUMNS, MBB_REFERENCE_UM, MBB_NORM_MJY, SED_PHOTOMETRY
+
+C_UM_GHZ = 299792.458  # speed of light in um * GHz
+H_OVER_K = 0.0479924   # Planck / Boltzmann constant in K / GHz
+MJY_HZ_TO_W_M2 = 1e-29 * 1e9  # mJy * GHz -> W / m^2
+MPC_M = 3.0856775814913673e22
+L_SUN_W = 3.828e26
+
+# Rest-frame 8-1000 um integration grid for L_IR
+LIR_GRID_GHZ = np.geomspace(C_UM_GHZ / 1000, C_UM_GHZ / 8, 256)
+# Observed wavelengths of the plotted model curve
+SED_GRID_UM = np.geomspace(100, 5000, 128)
+
+
+def mbb_rest_flux(nu_rest, log_norm, t_dust, beta):
+    """
+    Observed flux density (mJy) as a function of rest-frame frequency (GHz).
+
+    Parameters:
+    - nu_rest: frequency grid, shape (n_freq,)
+    - log_norm, t_dust, beta: per-source parameters, shape (n_sources,)
+
+    Returns:
+    - array of shape (n_sources, n_freq)
+    """
+    nu_ref = C_UM_GHZ / MBB_REFERENCE_UM
+    log_norm, t_dust, beta = (np.asarray(a, dtype=np.float64)[:, None] for a in (log_norm, t_dust, beta))
+    with np.errstate(over="ignore", divide="ignore", invalid="ignore"):
+        return (10**log_norm * MBB_NORM_MJY * (nu_rest / nu_ref)**(3 + beta)
+                * np.expm1(H_OVER_K * nu_ref / t_dust) / np.expm1(H_OVER_K * nu_rest / t_dust))
+
+
+def mbb_flux(nu_obs, z, log_norm, t_dust, beta):
+    """
+    Observed flux density (mJy) at observed frequencies nu_obs (GHz), shape (n_sources, n_freq).
+    """
+    z = np.asarray(z, dtype=np.float64)[:, None]
+    return mbb_rest_flux(nu_obs * (1 + z), log_norm, t_dust, beta)
+
+
+def mbb_column_names(columns):
+    """
+    The MBB fit columns configured in config.MBB_COLUMNS, if present among columns.
+
+    Returns:
+    - dict parameter -> column name, or None for parameters not configured or not found
+    """
+    return {name: column if column and column in columns else None for name, column in MBB_COLUMNS.items()}
+
+
+def missing_mbb_settings(columns):
+    """
+    The SPT3G_VIEWER_MBB_*_COLUMN settings that are unset or name no column among columns.
+    """
+    return [f"SPT3G_VIEWER_MBB_{name.upper()}_COLUMN"
+            for name, column in mbb_column_names(columns).items() if column is None]
+
+
+def mbb_parameters(catalog):
+    """
+    The (log_norm, t_dust, beta) arrays of a catalog with the columns added by add_mbb_columns.
+    """
+    return tuple(catalog[column].to_numpy(dtype=np.float64) for column in ("mbb_log_norm", "t_dust(k)", "mbb_beta"))
+
+
+def log_lir(z, log_norm, t_dust, beta):
+    """
+    log10 of the rest-frame 8-1000 um luminosity in solar luminosities. NaN where z <= 0.
+
+    L_IR = 4 pi D_L**2 / (1 + z) * integral of S over rest-frame frequency.
+    """
+    z = np.asarray(z, dtype=np.float64)
+    flux = mbb_rest_flux(LIR_GRID_GHZ, log_norm, t_dust, beta)
+    integral = np.trapezoid(flux, LIR_GRID_GHZ, axis=1) * MJY_HZ_TO_W_M2
+    valid = z > 0
+    d_l = np.full(len(z), np.nan)
+    d_l[valid] = Planck18.luminosity_distance(z[valid]).to_value("Mpc") * MPC_M
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.log10(4 * np.pi * d_l**2 * integral / (1 + z) / L_SUN_W)
+
+
+def add_mbb_columns(catalog):
+    """
+    Add the MBB parameter columns mbb_log_norm, t_dust(k) and mbb_beta (see mbb_column_names) and the derived
+    log_lir(lsun) to a catalog, computed for all rows at once. Parameters missing from the catalog are NaN.
+    """
+    names = mbb_column_names(catalog.columns)
+    log_norm, t_dust, beta = (
+        catalog[names[name]].to_numpy(dtype=np.float64) if names[name] is not None else np.full(len(catalog), np.nan)
+        for name in ("log_norm", "t_dust", "beta")
+    )
+    return catalog.assign(**{
+        "mbb_log_norm": log_norm,
+        "t_dust(k)": t_dust,
+        "mbb_beta": beta,
+        "log_lir(lsun)": log_lir(catalog["z"].to_numpy(dtype=np.float64), log_norm, t_dust, beta),
+    })
+
+
+def sed_figure(rows, theme="dark"):
+    """
+    SED plot of one or more catalog rows: the MBB model curve and the catalog photometry of each source,
+    sharing a color per source. The first row is the page's own source and is drawn on top. Sources without
+    finite fit parameters get no model curve.
+
+    Curves are evaluated for all rows in one call and sent as float32 arrays.
+    """
+    colors = px.colors.qualitative.Plotly
+    z = rows["z"].to_numpy(dtype=np.float64)
+    parameters = mbb_parameters(rows)
+    fitted = np.isfinite(z) & np.logical_and.reduce([np.isfinite(p) for p in parameters])
+    model = mbb_flux(C_UM_GHZ / SED_GRID_UM, z, *parameters).astype(np.float32)
+    wavelengths = SED_GRID_UM.astype(np.float32)
+    phot_columns = [column for column in SED_PHOTOMETRY if column in rows.columns]
+    phot_um = np.array([C_UM_GHZ / SED_PHOTOMETRY[column] for column in phot_columns], dtype=np.float32)
+
+    fig = go.Figure()
+    for i in reversed(range(len(rows))):
+        row = rows.iloc[i]
+        color = colors[i % len(colors)]
+        name = row["source_name"]
+        if fitted[i]:
+            fig.add_trace(go.Scatter(
+                x=wavelengths, y=model[i], mode="lines", name=name, legendgroup=name,
+                line=dict(color=color, width=3 if i == 0 else 2),
+                hovertemplate="%{x:.0f} μm: %{y:.3g} mJy<extra>" + name + "</extra>"
+            ))
+        if phot_columns:
+            fig.add_trace(go.Scatter(
+                x=phot_um, y=row[phot_columns].to_numpy(dtype=np.float32), mode="markers", name=name,
+                legendgroup=name, showlegend=not fitted[i], marker=dict(color=color, size=9, symbol="diamond"),
+                hovertemplate="%{x:.0f} μm: %{y:.3g} mJy<extra>" + name + "</extra>"
+            ))
+
+    fig.update_layout(
+        template="plotly_dark" if theme == "dark" else "plotly_white",
+        margin=dict(l=50, r=10, t=10, b=40),
+        paper_bgcolor="rgba(0,0,0,0)",
+        xaxis=dict(type="log", title="Observed wavelength (μm)"),
+        yaxis=dict(type="log", title="S (mJy)"),
+        legend=dict(orientation="h", y=1.02, yanchor="bottom", x=0, traceorder="reversed"),
+        showlegend=len(rows) > 1
+    )
+    return fig
@@ -0,0 +1,83 @@
+"""
+Signed, expiring URLs for the per-source asset trees (assets/[field root/]native|convolved/...).
+
+Two formats are supported, selected with SPT3G_VIEWER_ASSET_URL_SIGNING:
+
+- "hmac":  ?expires=<unix time>&sig=<base64url HMAC-SHA256 of "<expires>:<path>">; checked by the app itself
+           or, in front of it, by nginx `auth_request` against the /asset-auth verifier.
+- "nginx": ?md5=<base64url MD5 of "<expires><path> <secret>">&expires=<unix time>; the format of the nginx
+           secure_link module (`secure_link_md5 "$secure_link_expires$uri <secret>"`), so nginx can check
+           it without calling the app.
+
+Expiry times are rounded up to ASSET_URL_TTL_BUCKET, so a given asset keeps the same URL (and stays in the
+browser cache) for that long.
+"""
+import base64
+import hashlib
+import hmac
+import math
+import time
+from urllib.parse import urlsplit, parse_qs
+
+from config import (
+    ASSET_URL_SIGNING, ASSET_URL_SECRET, ASSET_URL_TTL, ASSET_URL_TTL_BUCKET, ASSET_MODES, FIELDS
+)
+
+
+def _b64url(digest):
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def _signature(path, expires, signing=ASSET_URL_SIGNING):
+    if signing == "nginx":
+        return _b64url(hashlib.md5(f"{expires}{path} {ASSET_URL_SECRET}".encode("utf-8")).digest())
+    return _b64url(hmac.new(ASSET_URL_SECRET.encode("utf-8"), f"{expires}:{path}".encode("utf-8"),
+                            hashlib.sha256).digest())
+
+
+def is_protected_asset(path):
+    """
+    True for paths inside one of the per-source asset trees.
+    """
+    return any(path.startswith(f"/assets/{field['asset_root']}{mode}/")
+               for field in FIELDS.values() for mode in ASSET_MODES)
+
+
+def sign_asset_url(path, now=None):
+    """
+    URL for an asset path such as /assets/native/mk/<source>_overlay.png; unchanged when signing is off.
+    """
+    if ASSET_URL_SIGNING == "off":
+        return path
+    now = time.time() if now is None else now
+    expires = math.ceil((now + ASSET_URL_TTL) / ASSET_URL_TTL_BUCKET) * ASSET_URL_TTL_BUCKET
+    signature = _signature(path, expires)
+    if ASSET_URL_SIGNING == "nginx":
+        return f"{path}?md5={signature}&expires={expires}"
+    return f"{path}?expires={expires}&sig={signature}"
+
+
+def verify_asset_request(path, args, now=None):
+    """
+    Check the signature and expiry of a request for path with query arguments args (a mapping).
+    """
+    if ASSET_URL_SIGNING == "off":
+        return True
+    try:
+        expires = int(args.get("expires", ""))
+    except ValueError:
+        return False
+    now = time.time() if now is None else now
+    if expires < now:
+        return False
+    given = args.get("md5" if ASSET_URL_SIGNING == "nginx" else "sig", "")
+    return hmac.compare_digest(given, _signature(path, expires))
+
+
+def verify_asset_uri(uri, now=None):
+    """
+    verify_asset_request for a full request URI (path and query string), as passed by a front proxy.
+    """
+    parts = urlsplit(uri)
+    args = {key: values[0] for key, values in parse_qs(parts.query).items()}
+    return verify_asset_request(parts.path, args, now)
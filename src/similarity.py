@@ -0,0 +1,52 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+from config import SIMILARITY_FEATURES, DEFAULT_FIELD
+from data_loader import get_field_data
+
+
+def get_similarity_index(field=DEFAULT_FIELD):
+    """
+    KD-tree over the standardized SIMILARITY_FEATURES of a field's catalog, built once per catalog snapshot.
+
+    Returns:
+    - dict with "features" (rows x features, zero mean and unit variance per feature; NaN set to 0, the mean)
+      and "tree", a cKDTree sharing that array. Features without any value, such as the MBB parameters when
+      the MBB fit columns are not configured, are left out.
+    """
+    return get_field_data(field).derived("similarity_index", _build_similarity_index)
+
+
+def _build_similarity_index(data):
+    columns = [column for column in SIMILARITY_FEATURES
+               if column in data.catalog.columns and data.catalog[column].notna().any()]
+    features = data.catalog[columns].to_numpy(dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        features = (features - np.nanmean(features, axis=0)) / np.nanstd(features, axis=0)
+    features = np.ascontiguousarray(np.nan_to_num(features, nan=0.0, posinf=0.0, neginf=0.0))
+    return {"features": features, "tree": cKDTree(features)}
+
+
+def similar_sources(row_id, k, field=DEFAULT_FIELD):
+    """
+    The k catalog rows nearest to row_id in standardized feature space, nearest first, excluding row_id itself.
+
+    Returns:
+    - (row IDs, distances) as numpy arrays
+    """
+    index = get_similarity_index(field)
+    n = min(k + 1, len(index["features"]))
+    if k <= 0 or n <= 1:
+        return np.empty(0, dtype=np.intp), np.empty(0)
+    # A list of neighbour ranks keeps the results 1-d even for a single neighbour
+    distances, row_ids = index["tree"].query(index["features"][row_id], k=list(range(1, n + 1)))
+    keep = row_ids != row_id
+    return row_ids[keep][:n - 1], distances[keep][:n - 1]
+
+
+def similarity_distances(row_id, row_ids, field=DEFAULT_FIELD):
+    """
+    Distance of each of row_ids to row_id in standardized feature space, e.g. to sort a filtered table.
+    """
+    features = get_similarity_index(field)["features"]
+    return np.linalg.norm(features[np.asarray(row_ids)] - features[row_id], axis=1)
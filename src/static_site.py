@@ -0,0 +1,311 @@
+"""
+Pre-render the catalog home page and every viewer page of a field as static HTML, for read-only deployments.
+
+The output directory can be served by any static file server, with no Python:
+
+    index.html                   catalog table (with a name filter) and the clickable field map
+    catalog.json                 the table rows of index.html
+    viewer/<source>/index.html   cutouts, SED, similar sources and Prev/Next links in catalog table order
+    plotly.min.js
+    assets                       link to (or copy of) the assets directory, see --assets
+
+Pages reuse the viewer's panel definitions (layouts.TOP_ROW_PANELS, layouts.SPIRE_ROW_PANELS) and reference the
+same asset files, with unsigned relative URLs. The Native/SPT-Convolved choice is kept in the browser. Files
+whose content did not change are not rewritten, so re-running after a data update only touches what changed.
+
+Usage:
+    python static_site.py --out site [--field ssdf] [--assets link|copy|none]
+"""
+import argparse
+import html as html_escape
+import json
+import os
+import re
+import shutil
+import sys
+from urllib.parse import quote
+
+import dash_bootstrap_components as dbc
+import plotly.io as pio
+from dash import html, dcc
+from plotly.offline import get_plotlyjs
+
+from config import FILE_PREFIX, FIELDS, DEFAULT_FIELD, TABLE_COLUMNS
+from data_loader import prepare_table_data, round_table_data
+from histograms import empty_filter_columns
+from html_utils import cutout_row
+from interactive_map import create_field_map_figure
+from layouts import notes, TOP_ROW_PANELS, SPIRE_ROW_PANELS, similar_panel, sed_fit_panel
+
+VOID_TAGS = {"img", "br", "hr", "input"}
+UNITLESS_STYLES = {"fontWeight", "lineHeight", "zIndex", "opacity", "flex", "flexGrow", "flexShrink"}
+SKIPPED_PROPS = {"children", "style", "id", "n_clicks", "n_clicks_timestamp", "disable_n_clicks"}
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<link rel="stylesheet" href="{bootstrap}">
+{stylesheets}
+<script src="{root}plotly.min.js"></script>
+</head>
+<body class="dark-mode">
+<div class="container-fluid">
+{body}
+</div>
+<script>
+{script}
+</script>
+</body>
+</html>
+"""
+
+# Resolution toggle: every cutout carries data-native and data-convolved URLs
+MODE_SCRIPT = """
+function setMode(mode) {
+    localStorage.setItem('resMode', mode);
+    document.querySelectorAll('img[data-native]').forEach(img => { img.src = img.dataset[mode]; });
+}
+setMode(localStorage.getItem('resMode') || 'native');
+"""
+
+HOME_SCRIPT = """
+const names = %s;
+document.getElementById('search-input').addEventListener('input', e => {
+    const text = e.target.value.toLowerCase();
+    document.querySelectorAll('#catalog-table tbody tr').forEach(tr => {
+        tr.style.display = tr.dataset.name.toLowerCase().includes(text) ? '' : 'none';
+    });
+});
+const map = document.getElementById('map-graph');
+map.on('plotly_click', data => {
+    const name = names[data.points[0].customdata];
+    if (name) { window.location.href = 'viewer/' + encodeURIComponent(name) + '/index.html'; }
+});
+"""
+
+
+def css(style):
+    items = []
+    for key, value in (style or {}).items():
+        if isinstance(value, (int, float)) and key not in UNITLESS_STYLES:
+            value = f"{value}px"
+        items.append(f"{re.sub(r'[A-Z]', lambda m: '-' + m.group(0).lower(), key)}: {value}")
+    return "; ".join(items)
+
+
+def render(component, rewrite):
+    """
+    Static HTML of a Dash component tree. Supports dash.html components, dcc.Link and dcc.Graph; URLs in
+    src, href and data-* attributes are passed through rewrite.
+    """
+    if component is None:
+        return ""
+    if isinstance(component, (str, int, float)):
+        return html_escape.escape(str(component))
+    if isinstance(component, (list, tuple)):
+        return "".join(render(child, rewrite) for child in component)
+
+    props = component.to_plotly_json()["props"]
+    kind = f"{component._namespace}.{component._type}"
+    if kind == "dash_core_components.Link":
+        return f'<a href="{html_escape.escape(rewrite(props["href"]))}">{render(props.get("children"), rewrite)}</a>'
+    if kind == "dash_core_components.Graph":
+        height = (props.get("style") or {}).get("height", "100%")
+        # a fixed div id keeps re-rendered pages byte-identical
+        return pio.to_html(props["figure"], include_plotlyjs=False, full_html=False, default_height=height,
+                           config=props.get("config"), div_id=props.get("id"))
+    if component._namespace != "dash_html_components":
+        raise ValueError(f"Cannot render {kind} statically")
+
+    tag = component._type.lower()
+    attrs = {}
+    if isinstance(props.get("id"), str):
+        attrs["id"] = props["id"]
+    if props.get("style"):
+        attrs["style"] = css(props["style"])
+    for name, value in props.items():
+        if name in SKIPPED_PROPS or value is None:
+            continue
+        name = {"className": "class", "htmlFor": "for"}.get(name, name)
+        if name in ("src", "href") or name.startswith("data-"):
+            value = rewrite(value)
+        attrs[name] = value
+    if tag == "img" and "data-src" in attrs:
+        # deferred panel: the browser's native lazy loading does the deferring here
+        attrs["src"] = attrs.pop("data-src")
+        attrs["loading"] = "lazy"
+        attrs["decoding"] = "async"
+    attr_text = "".join(f' {name}="{html_escape.escape(str(value))}"' for name, value in attrs.items())
+    if tag in VOID_TAGS:
+        return f"<{tag}{attr_text}>"
+    return f"<{tag}{attr_text}>{render(props.get('children'), rewrite)}</{tag}>"
+
+
+def url_rewriter(root):
+    """
+    Rewrite app URLs for a page root levels below the site root: /assets/... drops any signature and
+    /viewer/<source> points at that page's index.html.
+    """
+    def rewrite(url):
+        if not isinstance(url, str):
+            return url
+        if url.startswith("/assets/"):
+            return root + url.split("?")[0].lstrip("/")
+        if url.startswith("/viewer/"):
+            return f"{root}viewer/{quote(url[len('/viewer/'):])}/index.html"
+        if url == "/":
+            return root + "index.html"
+        return url
+    return rewrite
+
+
+def page(title, body, root, script="", stylesheets=()):
+    links = "\n".join(f'<link rel="stylesheet" href="{root}assets/{name}">' for name in stylesheets)
+    return PAGE_TEMPLATE.format(title=html_escape.escape(title), bootstrap=dbc.themes.SANDSTONE,
+                                stylesheets=links, root=root, body=body, script=script)
+
+
+def write_if_changed(path, text):
+    """
+    Write text to path unless the file already holds it. Returns True if the file was written.
+    """
+    data = text.encode("utf-8")
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return True
+
+
+def home_page(field, table_df, stylesheets):
+    rewrite = url_rewriter("")
+    rounded = round_table_data(table_df)
+    # NaN (e.g. T_dust and L_IR of sources without an MBB fit) becomes null, as JSON has no NaN
+    records = rounded.astype(object).where(rounded.notna(), None).to_dict("records")
+    empty_columns = empty_filter_columns(field)
+    columns = [column for column in TABLE_COLUMNS if column["id"] != "has_note" and column["id"] not in empty_columns]
+
+    map_fig = create_field_map_figure(table_df, field)
+    for image in map_fig.layout.images:
+        image.source = rewrite(image.source)
+
+    header = "".join(f"<th>{html_escape.escape(column['name'])}</th>" for column in columns)
+    rows = []
+    for record in records:
+        name = record["source_name"]
+        cells = [f'<td><a href="{rewrite("/viewer/" + name)}">{html_escape.escape(name)}</a></td>']
+        cells += [f"<td>{'' if record[column['id']] is None else record[column['id']]}</td>" for column in columns[1:]]
+        rows.append(f'<tr data-name="{html_escape.escape(name)}">{"".join(cells)}</tr>')
+
+    body = render(html.Div([
+        html.H1("SPT3G Source Catalog", style={"textAlign": "center", "marginTop": "20px", "marginBottom": "20px"}),
+        html.H3(f"All SPT3G SMGs in the {FIELDS[field]['label']} field. Click on a source in the table or on the "
+                "map to view its SPT3G, SPIRE and MeerKAT thumbnails and MBB fit.",
+                style={"textAlign": "center", "width": "50%", "marginLeft": "auto", "marginRight": "auto"}),
+    ]), rewrite)
+    body += f"""
+<div style="display: flex; justify-content: space-between; margin: 0 5%">
+  <div style="width: 65%; padding-right: 2%">
+    <input id="search-input" type="text" placeholder="Filter by source name, e.g., SPT3G..."
+           class="form-control" style="margin: 20px 0">
+    <div style="overflow-y: scroll; max-height: 80vh">
+      <table id="catalog-table" class="table table-sm table-hover">
+        <thead><tr>{header}</tr></thead>
+        <tbody>{"".join(rows)}</tbody>
+      </table>
+    </div>
+  </div>
+  <div id="map" style="width: 35%; position: sticky; top: 20px">
+    {render(dcc.Graph(id="map-graph", figure=map_fig, style={"height": "50vh"}), rewrite)}
+  </div>
+</div>
+"""
+    names = {int(row_id): name for row_id, name in zip(table_df.index, table_df["source_name"])}
+    return page("SPT3G Source Catalog", body, "", HOME_SCRIPT % json.dumps(names), stylesheets), records
+
+
+def viewer_page(source_name, field, previous_name, next_name, stylesheets, include_notes=False):
+    root = "../../"
+    rewrite = url_rewriter(root)
+    asset_root = FIELDS[field]["asset_root"]
+    button = {"className": "btn btn-info", "style": {"margin": "10px"}}
+
+    content = [
+        html.H1(f"{source_name} cutouts", style={"textAlign": "center", "marginBottom": "30px"}),
+        html.Div([
+            html.Button("Native", **{"data-mode": "native"}, **button),
+            html.Button("SPT-Convolved", **{"data-mode": "convolved"}, **button),
+        ], style={"textAlign": "center", "marginBottom": "20px"}),
+        cutout_row(TOP_ROW_PANELS + [sed_fit_panel(source_name, field, compare=False)], source_name,
+                   asset_root=asset_root),
+        cutout_row(SPIRE_ROW_PANELS, source_name, asset_root=asset_root),
+        similar_panel(source_name, field=field),
+    ]
+    if include_notes and notes.get(source_name):
+        content.append(html.Div([html.H4("Notes"), html.P(notes[source_name], style={"whiteSpace": "pre-wrap"})],
+                                style={"width": "75%", "margin": "0 auto"}))
+    content.append(html.Div([
+        html.A("◀️ Previous", href=f"/viewer/{previous_name}", **button),
+        html.A("Back to Home", href="/", className="btn btn-secondary", style={"margin": "10px"}),
+        html.A("▶️ Next", href=f"/viewer/{next_name}", **button),
+    ], style={"textAlign": "center", "marginTop": "20px"}))
+
+    body = render(html.Div(content), rewrite)
+    script = MODE_SCRIPT + """
+document.querySelectorAll('button[data-mode]').forEach(b => b.addEventListener('click', () => setMode(b.dataset.mode)));
+"""
+    return page(f"{source_name} cutouts", body, root, script, stylesheets)
+
+
+def link_assets(out_dir, how):
+    assets_dir = os.path.abspath(FILE_PREFIX + "assets")
+    target = os.path.join(out_dir, "assets")
+    if how == "none" or os.path.lexists(target):
+        return
+    if how == "link":
+        os.symlink(assets_dir, target)
+    else:
+        shutil.copytree(assets_dir, target)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--field", default=DEFAULT_FIELD, choices=list(FIELDS))
+    parser.add_argument("--assets", default="link", choices=["link", "copy", "none"],
+                        help="symlink (default) or copy the assets directory into the site, or leave it out")
+    parser.add_argument("--include-notes", action="store_true", help="show reviewer notes (read-only) on the pages")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out, exist_ok=True)
+    assets_dir = FILE_PREFIX + "assets"
+    stylesheets = sorted(name for name in os.listdir(assets_dir) if name.endswith(".css"))
+    written = write_if_changed(os.path.join(args.out, "plotly.min.js"), get_plotlyjs())
+
+    table_df = prepare_table_data(notes, args.field)
+    home_html, records = home_page(args.field, table_df, stylesheets)
+    written += write_if_changed(os.path.join(args.out, "index.html"), home_html)
+    written += write_if_changed(os.path.join(args.out, "catalog.json"), json.dumps(records, allow_nan=False))
+
+    names = table_df["source_name"].tolist()
+    for i, source_name in enumerate(names):
+        text = viewer_page(source_name, args.field, names[i - 1], names[(i + 1) % len(names)], stylesheets,
+                           args.include_notes)
+        written += write_if_changed(os.path.join(args.out, "viewer", source_name, "index.html"), text)
+        if (i + 1) % 200 == 0:
+            print(f"rendered {i + 1}/{len(names)} viewer pages", file=sys.stderr)
+
+    link_assets(args.out, args.assets)
+    print(f"{len(names) + 3} files, {written} written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
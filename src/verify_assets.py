@@ -0,0 +1,153 @@
+"""
+Verify the assets tree against dataset.md5sums and list the files that need to be synced.
+
+Hashes are cached by (path, size, mtime), so re-runs only hash files that changed since the last run.
+Files that are missing or do not match the manifest are written to the delta list, one path per line
+relative to the assets root, ready for `rsync --files-from`.
+
+Usage:
+    python verify_assets.py --root assets --manifest ../dataset.md5sums --delta delta.txt
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from config import FILE_PREFIX
+
+CHUNK_SIZE = 1024**2
+
+
+def read_manifest(manifest_path):
+    """
+    Parse an md5sum manifest into {relative path: md5}.
+    """
+    manifest = {}
+    with open(manifest_path) as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line:
+                continue
+            md5, path = line.split(None, 1)
+            manifest[os.path.normpath(path.lstrip("*"))] = md5.lower()
+    return manifest
+
+
+def load_cache(cache_path):
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path) as f:
+            return json.load(f)
+    return {}
+
+
+def save_cache(cache_path, cache):
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, cache_path)
+
+
+def md5_file(path, chunk_size=CHUNK_SIZE):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verify(root, manifest, cache, workers):
+    """
+    Compare the files under root with the manifest.
+
+    Returns:
+    - missing, mismatched: sorted lists of relative paths
+    - hashed: number of files that had to be hashed (cache misses)
+    Updates cache in place with the hash of every file present.
+    """
+    missing, mismatched, to_hash = [], [], []
+
+    for rel_path, expected in manifest.items():
+        try:
+            st = os.stat(os.path.join(root, rel_path))
+        except FileNotFoundError:
+            missing.append(rel_path)
+            continue
+        cached = cache.get(rel_path)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            if cached[2] != expected:
+                mismatched.append(rel_path)
+        else:
+            to_hash.append((rel_path, st))
+
+    last_report = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(md5_file, os.path.join(root, rel_path)): (rel_path, st) for rel_path, st in to_hash}
+        for done, future in enumerate(as_completed(futures), start=1):
+            rel_path, st = futures[future]
+            try:
+                md5 = future.result()
+            except OSError:
+                missing.append(rel_path)
+                continue
+            cache[rel_path] = [st.st_size, st.st_mtime_ns, md5]
+            if md5 != manifest[rel_path]:
+                mismatched.append(rel_path)
+            if time.time() - last_report > 5:
+                print(f"hashed {done}/{len(to_hash)} files", file=sys.stderr)
+                last_report = time.time()
+
+    return sorted(missing), sorted(mismatched), len(to_hash)
+
+
+def find_extra(root, manifest):
+    """
+    Files under root that are not listed in the manifest.
+    """
+    extra = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            rel_path = os.path.normpath(os.path.relpath(os.path.join(dirpath, filename), root))
+            if rel_path not in manifest:
+                extra.append(rel_path)
+    return sorted(extra)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root", default=FILE_PREFIX + "assets", help="assets directory to verify")
+    parser.add_argument("--manifest", default="../dataset.md5sums", help="md5sum manifest")
+    parser.add_argument("--cache", default="asset_verify_cache.json",
+                        help="(path, size, mtime) -> md5 cache file; pass an empty string to disable")
+    parser.add_argument("--delta", help="write missing and mismatched paths here, one per line")
+    parser.add_argument("--extra", action="store_true", help="also report files not in the manifest")
+    parser.add_argument("--workers", type=int, default=min(32, (os.cpu_count() or 1) * 4),
+                        help="hashing threads")
+    args = parser.parse_args(argv)
+
+    manifest = read_manifest(args.manifest)
+    cache = load_cache(args.cache)
+    missing, mismatched, hashed = verify(args.root, manifest, cache, args.workers)
+    if args.cache:
+        save_cache(args.cache, cache)
+
+    print(f"{len(manifest)} files in manifest, {hashed} hashed, {len(missing)} missing, {len(mismatched)} mismatched")
+    for rel_path in missing:
+        print(f"MISSING  {rel_path}")
+    for rel_path in mismatched:
+        print(f"MISMATCH {rel_path}")
+    if args.extra:
+        for rel_path in find_extra(args.root, manifest):
+            print(f"EXTRA    {rel_path}")
+
+    if args.delta:
+        with open(args.delta, "w") as f:
+            f.writelines(f"{rel_path}\n" for rel_path in sorted(missing + mismatched))
+
+    return 1 if missing or mismatched else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())